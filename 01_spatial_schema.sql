@@ -13,6 +13,8 @@ DROP TABLE IF EXISTS spatial.provinces_geom CASCADE;
 
 DROP TABLE IF EXISTS spatial.religions_geom CASCADE;
 
+DROP TABLE IF EXISTS spatial.states_geom CASCADE;
+
 DROP TABLE IF EXISTS spatial.routes_geom CASCADE;
 
 DROP TABLE IF EXISTS spatial.routes_geom_staging CASCADE;
@@ -23,6 +25,8 @@ DROP TABLE IF EXISTS spatial.cells_geom CASCADE;
 
 DROP TABLE IF EXISTS spatial.cells_geom_staging CASCADE;
 
+DROP TABLE IF EXISTS spatial.cell_edges CASCADE;
+
 DROP TABLE IF EXISTS spatial.landmass_geom CASCADE;
 
 DROP TABLE IF EXISTS spatial.landmass CASCADE;
@@ -58,6 +62,8 @@ CREATE TABLE
     geom geometry (MultiPolygon, 4326)
   );
 
+CREATE INDEX IF NOT EXISTS idx_biomes_geom_geom ON spatial.biomes_geom USING GIST (geom);
+
 -- Cultures geometry
 CREATE TABLE
   spatial.cultures_geom (
@@ -65,6 +71,8 @@ CREATE TABLE
     geom geometry (MultiPolygon, 4326)
   );
 
+CREATE INDEX IF NOT EXISTS idx_cultures_geom_geom ON spatial.cultures_geom USING GIST (geom);
+
 -- Markers geometry
 CREATE TABLE
   spatial.markers_geom (id TEXT PRIMARY KEY, geom geometry (Point, 4326));
@@ -76,6 +84,8 @@ CREATE TABLE
     geom geometry (MultiPolygon, 4326)
   );
 
+CREATE INDEX IF NOT EXISTS idx_provinces_geom_geom ON spatial.provinces_geom USING GIST (geom);
+
 -- Religions geometry
 CREATE TABLE
   spatial.religions_geom (
@@ -83,6 +93,17 @@ CREATE TABLE
     geom geometry (MultiPolygon, 4326)
   );
 
+CREATE INDEX IF NOT EXISTS idx_religions_geom_geom ON spatial.religions_geom USING GIST (geom);
+
+-- States geometry (cells dissolved by state)
+CREATE TABLE
+  spatial.states_geom (
+    id INTEGER PRIMARY KEY,
+    geom geometry (MultiPolygon, 4326)
+  );
+
+CREATE INDEX IF NOT EXISTS idx_states_geom_geom ON spatial.states_geom USING GIST (geom);
+
 -- Routes geometry
 CREATE TABLE
   spatial.routes_geom (
@@ -130,6 +151,16 @@ CREATE TABLE
     geojsondata jsonb
   );
 
+-- Cell adjacency, one row per directed edge (from the cells' neighbors)
+CREATE TABLE
+  spatial.cell_edges (
+    src INTEGER NOT NULL,
+    dst INTEGER NOT NULL,
+    PRIMARY KEY (src, dst)
+  );
+
+CREATE INDEX IF NOT EXISTS idx_cell_edges_dst ON spatial.cell_edges (dst);
+
 -- Landmass (for full polygons with holes)
 CREATE TABLE
   spatial.landmass_geom (
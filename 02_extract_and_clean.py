@@ -1,18 +1,26 @@
 import xml.etree.ElementTree as ET
+import argparse
 import logging
-import re
 import os
-import json
 import sys
-import csv
 import geojson
-from svgpathtools import parse_path
+from functools import partial
+import shapely
 from shapely.geometry import Polygon, mapping, LineString
-from shapely.ops import unary_union
-from tqdm import tqdm
-from typing import Optional
 from geom_utils import *
-from shapely.errors import TopologicalError
+from csv_clean import CSV_COLUMNS, clean_csv, cleaned_name
+from cell_graph import CELL_GRAPH_FILE, load_csr, write_cell_graph
+from geojson_utils import feature_writer, iter_features
+from geoparquet import PARQUET_EXTENSION, require_pyarrow
+from pg_loader import INTERMEDIATE_FORMATS
+from import_scheduler import DB_WORKERS, print_results, run_import, table_row_counts
+from schema_swap import import_with_swap
+from delta_import import import_delta, record_hashes
+from stage_cache import CACHE_DIR, StageCache
+from tile_pyramid import TILES_FILE, map_size, render_pyramid
+from metrics import PROFILE_DIR, PROM_TEXTFILE_DIR, Metrics, profiled
+from zip_source import ZipSource, open_source, source_exists
+from shapely.errors import GEOSException, TopologicalError
 
 
 # ===========================
@@ -38,14 +46,15 @@ RIVERS_OUTPUT_FILE = os.path.join(DATA_DIR, "openheim_rivers_cleaned.geojson")
 SVG_NAMESPACE = "{http://www.w3.org/2000/svg}"
 XLINK_NAMESPACE = "{http://www.w3.org/1999/xlink}"
 SVG_HEIGHT = 2000  # Set to your SVG's height
+CHUNKS_PER_WORKER = 4  # Geometry work is split finer than --workers for load balancing
+FEATURE_BATCH_SIZE = 10000  # Features per vectorized transform in clean_file
 
 FILES_TO_CLEAN = [
     os.path.join(DATA_DIR, "/srv/data-loader/data/cells.geojson"),
     os.path.join(DATA_DIR, "/srv/data-loader/data/markers.geojson"),
     # os.path.join(DATA_DIR, "/srv/data-loader/data/rivers.geojson"), commented out beacause i am using svg file for river
     os.path.join(DATA_DIR, "/srv/data-loader/data/routes.geojson"),
-    LAND_OUTPUT_FILE,
-    RIVERS_OUTPUT_FILE,
+    # LAND_OUTPUT_FILE and RIVERS_OUTPUT_FILE are cleaned in memory (and, with --load, never written)
 ]
 
 # ===========================
@@ -53,105 +62,200 @@ FILES_TO_CLEAN = [
 # ===========================
 
 
-def extract_river_paths(root):
-    river_features = []
-    for path_elem in root.findall(f".//{SVG_NAMESPACE}path"):
-        path_id = path_elem.attrib.get("id")
-        d = path_elem.attrib.get("d")
-        if not d or not path_id or not path_id.startswith("river"):
+def iter_svg_paths(svg_file):
+    """
+    Streams the SVG with iterparse and sorts every <path> into land, freshwater
+    or river buckets in a single pass. Returns three lists of (path_id, d).
+
+    Land and freshwater membership comes from the <use> references in
+    <mask id="land"> and <g id="freshwater">. FMG writes the feature paths in
+    <defs> before those references, so unresolved paths are kept as raw `d`
+    strings until the end of the document. Elements are cleared and detached
+    from their parent as soon as they are closed, so the DOM is never held
+    in memory.
+    """
+    land_ids = set()
+    freshwater_ids = set()
+    river_paths = []
+    candidate_paths = []
+    # Ancestor stack of (tag, id) so <use> elements can be attributed to their mask/group
+    stack = []
+    # Open elements, so closed children can be removed from their parent
+    elements = []
+
+    for event, elem in ET.iterparse(svg_file, events=("start", "end")):
+        if event == "start":
+            if elem.tag == f"{SVG_NAMESPACE}use" and stack:
+                href = elem.attrib.get(f"{XLINK_NAMESPACE}href")
+                if href:
+                    parent_tag, parent_id = stack[-1]
+                    if (
+                        parent_tag == f"{SVG_NAMESPACE}mask"
+                        and parent_id == "land"
+                        and elem.attrib.get("fill") == "white"
+                    ):
+                        land_ids.add(href.lstrip("#"))
+                    elif (f"{SVG_NAMESPACE}g", "freshwater") in stack:
+                        freshwater_ids.add(href.lstrip("#"))
+            stack.append((elem.tag, elem.attrib.get("id")))
+            elements.append(elem)
             continue
-        coords = svg_path_to_coords(d)
-        coords = deduplicate(coords)
+
+        stack.pop()
+        elements.pop()
+        if elem.tag == f"{SVG_NAMESPACE}path":
+            path_id = elem.attrib.get("id")
+            d = elem.attrib.get("d")
+            if d and path_id:
+                if path_id.startswith("river"):
+                    river_paths.append((path_id, d))
+                else:
+                    candidate_paths.append((path_id, d))
+        elem.clear()
+        if elements:
+            elements[-1].remove(elem)
+
+    land_paths = []
+    freshwater_paths = []
+    for path_id, d in candidate_paths:
+        if path_id in land_ids:
+            land_paths.append((path_id, d))
+        elif path_id in freshwater_ids:
+            freshwater_paths.append((path_id, d))
+    logger.info(
+        f"Streamed SVG: {len(land_paths)} land, {len(freshwater_paths)} freshwater "
+        f"and {len(river_paths)} river paths."
+    )
+    return land_paths, freshwater_paths, river_paths
+
+
+def _build_river_lines(river_paths, tolerance, simplify_tolerance):
+    """Worker: (path_id, d) pairs -> (river_id, LineString WKB) pairs."""
+    river_ids = []
+    lines = []
+    all_coords = svg_paths_to_coords([d for _, d in river_paths], tolerance)
+    for (path_id, _), coords in zip(river_paths, all_coords):
         coords = flip_y(coords, SVG_HEIGHT)
         if len(coords) > 1:
-            line = LineString(coords)
-            river_id = strip_river_prefix_and_make_int(path_id)
+            lines.append(LineString(coords))
+            river_ids.append(strip_river_prefix_and_make_int(path_id))
+    if simplify_tolerance:
+        lines = simplify_geometries(lines, simplify_tolerance)
+    return list(zip(river_ids, shapely.to_wkb(lines)))
+
+
+def extract_river_paths(
+    river_paths, tolerance=None, simplify_tolerance=None, workers=1
+):
+    chunks = [
+        (chunk, tolerance, simplify_tolerance)
+        for chunk in split_chunks(river_paths, workers * CHUNKS_PER_WORKER)
+    ]
+    river_features = []
+    for chunk in map_chunks(_build_river_lines, chunks, workers):
+        for river_id, wkb in chunk:
             river_features.append(
                 geojson.Feature(
-                    geometry=mapping(line), properties={"id": river_id, "type": "river"}
+                    geometry=mapping(shapely.from_wkb(wkb)),
+                    properties={"id": river_id, "type": "river"},
                 )
             )
     logger.info(f"Extracted {len(river_features)} river features from SVG.")
     return river_features
 
 
-def extract_land_and_freshwater(root):
-    # Find land mask and referenced feature IDs
-    land_mask = root.find(f".//{SVG_NAMESPACE}mask[@id='land']")
-    land_ids = []
-    if land_mask is not None:
-        for use in land_mask.findall(f"{SVG_NAMESPACE}use"):
-            href = use.attrib.get(f"{XLINK_NAMESPACE}href")
-            if href and use.attrib.get("fill") == "white":
-                land_ids.append(href.lstrip("#"))
-
-    # Find freshwater lake IDs from <g id="freshwater">/<use>
-    freshwater_root = root.find(f".//{SVG_NAMESPACE}g[@id='freshwater']")
-    freshwater_ids = []
-    if freshwater_root is not None:
-        for use in freshwater_root.findall(f".//{SVG_NAMESPACE}use"):
-            href = use.attrib.get(f"{XLINK_NAMESPACE}href")
-            if href:
-                freshwater_ids.append(href.lstrip("#"))
-
-    land_polys = []
-    freshwater_polys = []
-    for path_elem in root.findall(f".//{SVG_NAMESPACE}path"):
-        path_id = path_elem.attrib.get("id")
-        d = path_elem.attrib.get("d")
-        if not d:
-            continue
-        coords = svg_path_to_coords(d)
-        coords = deduplicate(coords)
+def _build_polygons(paths, tolerance):
+    """Worker: (path_id, d) pairs -> (path_id, repaired Polygon WKB) pairs."""
+    polys = []
+    all_coords = svg_paths_to_coords([d for _, d in paths], tolerance)
+    for (path_id, _), coords in zip(paths, all_coords):
         coords = ensure_closed(coords)
         coords = flip_y(coords, SVG_HEIGHT)
         if len(coords) > 3:
             poly = Polygon(coords)
             if not poly.is_valid:
                 poly = poly.buffer(0)
-            if path_id in land_ids:
-                land_polys.append((path_id, poly))
-            elif path_id in freshwater_ids:
-                freshwater_polys.append((path_id, poly))
+            polys.append((path_id, poly.wkb))
+    return polys
+
+
+def paths_to_polygons(paths, tolerance=None, workers=1):
+    chunks = [
+        (chunk, tolerance) for chunk in split_chunks(paths, workers * CHUNKS_PER_WORKER)
+    ]
+    results = [
+        pair for chunk in map_chunks(_build_polygons, chunks, workers) for pair in chunk
+    ]
+    geoms = shapely.from_wkb([wkb for _, wkb in results])
+    return [(path_id, geom) for (path_id, _), geom in zip(results, geoms)]
+
+
+def extract_land_and_freshwater(
+    land_paths, freshwater_paths, tolerance=None, workers=1
+):
+    land_polys = paths_to_polygons(land_paths, tolerance, workers)
+    freshwater_polys = paths_to_polygons(freshwater_paths, tolerance, workers)
     logger.info(
         f"Extracted {len(land_polys)} land polygons and {len(freshwater_polys)} freshwater polygons."
     )
     return land_polys, freshwater_polys
 
 
-def make_land_features(land_polys, freshwater_polys):
+def _build_land_parts(land_wkbs, hole_wkb_groups, simplify_tolerance):
+    """
+    Worker: subtracts each land polygon's group of intersecting lakes, splits
+    the result into polygons and returns their GeoJSON geometries per land.
+    """
+    lands = shapely.from_wkb(land_wkbs)
     try:
-        all_freshwater = (
-            unary_union([poly for _, poly in freshwater_polys])
-            if freshwater_polys
-            else None
-        )
-    except TopologicalError as e:
-        logger.error(f"Failed to union freshwater polys: {e}")
-        all_freshwater = None
+        lands = subtract_groups(lands, [shapely.from_wkb(g) for g in hole_wkb_groups])
+    except (TopologicalError, GEOSException) as e:
+        logger.error(f"Failed to subtract freshwater polys: {e}")
+
+    parts_per_land = []
+    for land_with_holes in lands:
+        if land_with_holes.geom_type == "Polygon":
+            geoms = [land_with_holes]
+        elif land_with_holes.geom_type == "MultiPolygon":
+            geoms = list(land_with_holes.geoms)
+        else:
+            geoms = []
+        if simplify_tolerance and geoms:
+            geoms = simplify_geometries(geoms, simplify_tolerance)
+        parts_per_land.append([mapping(geom) for geom in geoms if not geom.is_empty])
+    return parts_per_land
+
 
+def make_land_features(
+    land_polys, freshwater_polys, simplify_tolerance=None, workers=1
+):
     land_features = []
     logger.info(f"Received {len(land_polys)} land polygons")
     assert all(
         isinstance(x, tuple) and len(x) == 2 for x in land_polys
     ), "Malformed land_polys"
 
-    for land_id, land_poly in tqdm(land_polys, desc="Processing land polygons"):
-        if all_freshwater:
-            land_with_holes = land_poly.difference(all_freshwater)
-        else:
-            land_with_holes = land_poly
-        if land_with_holes.geom_type == "Polygon":
-            geoms = [land_with_holes]
-        elif land_with_holes.geom_type == "MultiPolygon":
-            geoms = list(land_with_holes.geoms)
-        else:
-            continue
+    land_geoms = [poly for _, poly in land_polys]
+    freshwater_geoms = [poly for _, poly in freshwater_polys]
+    hole_groups = intersecting_groups(land_geoms, freshwater_geoms)
+    freshwater_wkbs = shapely.to_wkb(freshwater_geoms)
+    items = list(
+        zip(shapely.to_wkb(land_geoms), [freshwater_wkbs[g] for g in hole_groups])
+    )
+    chunks = [
+        ([w for w, _ in chunk], [g for _, g in chunk], simplify_tolerance)
+        for chunk in split_chunks(items, workers * CHUNKS_PER_WORKER)
+    ]
+    parts = [
+        p for chunk in map_chunks(_build_land_parts, chunks, workers) for p in chunk
+    ]
+
+    for (land_id, _), geoms in zip(land_polys, parts):
+        land_id_clean = strip_river_prefix_and_make_int(land_id)
         for geom in geoms:
-            land_id_clean = strip_river_prefix_and_make_int(land_id)
             land_features.append(
                 geojson.Feature(
-                    geometry=mapping(geom),
+                    geometry=geom,
                     properties={"id": land_id_clean, "type": "land"},
                 )
             )
@@ -164,20 +268,21 @@ def make_land_features(land_polys, freshwater_polys):
 # ===========================
 
 
-def clean_file(infile):
-    if not os.path.exists(infile):
-        logger.warning(f"File does not exist and will be skipped: {infile}")
-        return
-
-    with open(infile, "r") as f:
-        data = json.load(f)
-
+def clean_features(features, infile):
+    """
+    Normalizes the feature ids for the kind of file they come from and flips Y
+    for markers, routes and cells (one vectorized transform per batch).
+    Returns True if any feature was changed.
+    """
+    # The kind comes from the file name alone; directories (--data-dir, the
+    # per-version scratch dir) may contain any of these words
+    name = os.path.basename(infile)
     changed = False
-    for feat in data.get("features", []):
+    for feat in features:
         old_id = feat["properties"].get("id")
-        if "markers" in infile:
+        if "markers" in name:
             new_id = strip_marker_prefix_and_make_int(old_id)
-        elif "rivers" in infile:
+        elif "rivers" in name:
             new_id = strip_river_prefix_and_make_int(old_id)
         else:
             new_id = clean_id(old_id)
@@ -185,147 +290,361 @@ def clean_file(infile):
             feat["properties"]["id"] = new_id
             changed = True
 
-        # Flip Y coordinates for these types
-        if any(key in infile for key in ["markers", "routes", "cells"]):
-            flip_y_coords_in_feature(feat, SVG_HEIGHT)
-            changed = True
+    # Flip Y coordinates for these types
+    if features and any(key in name for key in ["markers", "routes", "cells"]):
+        flip_y_coords_in_features(features, SVG_HEIGHT)
+        changed = True
+    return changed
+
+
+def clean_file(infile, outfile=None):
+    """
+    Cleans a GeoJSON file (or zip member) in batches of features: streams it
+    in, writes compact output to a temp file and renames it over outfile
+    (default: the original), so memory use does not depend on the size of
+    the file.
+    """
+    if not source_exists(infile):
+        logger.warning(f"File does not exist and will be skipped: {infile}")
+        return
+    outfile = outfile or infile
+
+    changed = False
+    with feature_writer(outfile) as writer, open_source(infile) as f:
+        batch = []
+        for feat in iter_features(f):
+            batch.append(feat)
+            if len(batch) == FEATURE_BATCH_SIZE:
+                changed = clean_features(batch, outfile) or changed
+                writer.write_many(batch)
+                batch = []
+        changed = clean_features(batch, outfile) or changed
+        writer.write_many(batch)
+        if not changed and outfile == infile:
+            writer.discard()
 
     if changed:
-        with open(infile, "w") as f:
-            json.dump(data, f, indent=2)
-        logger.info(f"Cleaned and flipped (if needed): {infile}")
+        logger.info(f"Cleaned and flipped (if needed): {infile} -> {outfile}")
     else:
         logger.info(f"No change needed: {infile}")
 
 
-def validate_geojson_file(filepath, allowed_types):
+def find_geometry_errors(features, allowed_types, source):
     errors = []
-    if not os.path.exists(filepath):
-        logger.warning(f"Validation skipped (file not found): {filepath}")
-        return
-    with open(filepath, "r") as f:
-        data = json.load(f)
-    for i, feat in enumerate(data.get("features", [])):
-        geom_type = feat.get("geometry", {}).get("type")
+    for i, feat in enumerate(features):
+        geom_type = (feat.get("geometry") or {}).get("type")
         if geom_type not in allowed_types:
             errors.append(
-                f"{filepath} feature {i} has geometry type '{geom_type}', expected {allowed_types}"
+                f"{source} feature {i} has geometry type '{geom_type}', expected {allowed_types}"
             )
+    return errors
+
+
+def report_validation(errors, source):
     if errors:
-        logger.error(f"VALIDATION ERRORS in {filepath}:")
+        logger.error(f"VALIDATION ERRORS in {source}:")
         for err in errors:
             logger.error("  " + err)
         logger.error("Validation failed.")
         sys.exit(1)
     else:
-        logger.info(f"Validation passed: {filepath}")
+        logger.info(f"Validation passed: {source}")
+
+
+def validate_geojson_file(filepath, allowed_types):
+    if not os.path.exists(filepath):
+        logger.warning(f"Validation skipped (file not found): {filepath}")
+        return
+    errors = find_geometry_errors(iter_features(filepath), allowed_types, filepath)
+    report_validation(errors, filepath)
+
 
+def clean_and_validate(features, outfile, allowed_types):
+    """Cleans ids and validates geometry types of extracted features in memory."""
+    clean_features(features, outfile)
+    report_validation(find_geometry_errors(features, allowed_types, outfile), outfile)
 
-def clean_markers_csv(input_csv, output_csv):
+
+def clean_validate_and_write(features, outfile, allowed_types):
     """
-    Reads a CSV, removes 'marker' from the Id column (leaving only the number), and writes to output_csv.
+    Cleans ids, validates geometry types and writes extracted features in one
+    pass, so the output file is written once and never read back.
     """
-    with open(input_csv, "r", newline="", encoding="utf-8") as infile, open(
-        output_csv, "w", newline="", encoding="utf-8"
-    ) as outfile:
-        reader = csv.DictReader(infile)
-        fieldnames = reader.fieldnames
-        if fieldnames is None:
-            raise ValueError("fieldnames must not be None")
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in reader:
-            id_val = row.get("Id")
-            if isinstance(id_val, str):
-                match = re.match(r"marker\s*(\d+)", id_val.strip())
-                if match:
-                    row["Id"] = match.group(1)
-            writer.writerow(row)
-    logger.info(f"Cleaned markers csv: {input_csv} -> {output_csv}")
-
-
-def extract_km(value: str) -> Optional[float]:
-    """Extracts the float value in kilometers from a string like '62 km'."""
-    if not value:
-        return None
-    match = re.search(r"([0-9.]+)\s*km", value)
-    return float(match.group(1)) if match else None
-
-
-def extract_cms(value: str) -> Optional[float]:
-    """Extracts the float value in m³/s from a string like '8523 m³/s'."""
-    if not value:
-        return None
-    match = re.search(r"([0-9.]+)\s*m³/s", value)
-    return float(match.group(1)) if match else None
-
-
-def clean_rivers_csv(input_file: str, output_file: str):
+    clean_and_validate(features, outfile, allowed_types)
+    with feature_writer(outfile) as writer:
+        writer.write_many(features)
+    logger.info(f"Cleaned, validated and wrote {writer.count} features to {outfile}")
+
+
+# ===========================
+# Stage cache
+# ===========================
+
+
+def cached_stage(cache, stage, inputs, outputs, func, config=None):
+    """Runs func() unless the cache holds outputs for identical inputs."""
+    if cache is None:
+        func()
+    else:
+        cache.run(stage, inputs, outputs, func, config)
+
+
+def input_source(args, archive, name):
+    """Export file `name`: a member of the --zip archive, else the file in --data-dir."""
+    return archive.member(name) if archive else os.path.join(args.data_dir, name)
+
+
+def output_path(args, path):
+    """Where this script writes the file `path` names: in --data-dir."""
+    return os.path.join(args.data_dir, os.path.basename(path))
+
+
+def intermediate_path(args, path):
+    """output_path() of a cleaned GeoJSON file, as .parquet with --intermediate geoparquet."""
+    path = output_path(args, path)
+    if args.intermediate == "geoparquet":
+        return os.path.splitext(path)[0] + PARQUET_EXTENSION
+    return path
+
+
+def attr_sql_files(args):
+    """
+    Replacements for the DATA_DIR paths that 04_bulk_attribute_import.sql
+    \\copy's from: the *_cleaned.csv files written to --data-dir.
+    """
+    return {
+        os.path.join(DATA_DIR, cleaned_name(name)): output_path(
+            args, cleaned_name(name)
+        )
+        for name in CSV_COLUMNS
+    }
+
+
+def extract_svg_features(args, metrics, svg):
+    logger.info(f"Parsing SVG file: {svg}")
+    with metrics.stage("parse_svg"), open_source(svg, text=False) as f:
+        land_paths, freshwater_paths, river_paths = iter_svg_paths(f)
+
+    with metrics.stage("extract_land_and_freshwater"):
+        land_polys, freshwater_polys = extract_land_and_freshwater(
+            land_paths, freshwater_paths, args.densify_tolerance, args.workers
+        )
+    with metrics.stage("make_land_features"):
+        land_features = make_land_features(
+            land_polys, freshwater_polys, args.simplify_tolerance, args.workers
+        )
+
+    # With --load the features go straight to PostGIS, no GeoJSON hop
+    finish = clean_and_validate if args.load else clean_validate_and_write
+    with metrics.stage("clean_land", rows=len(land_features)):
+        finish(
+            land_features,
+            intermediate_path(args, LAND_OUTPUT_FILE),
+            {"Polygon", "MultiPolygon"},
+        )
+
+    with metrics.stage("extract_river_paths"):
+        river_features = extract_river_paths(
+            river_paths, args.densify_tolerance, args.simplify_tolerance, args.workers
+        )
+    with metrics.stage("clean_rivers", rows=len(river_features)):
+        finish(
+            river_features,
+            intermediate_path(args, RIVERS_OUTPUT_FILE),
+            {"LineString"},
+        )
+    return land_features, river_features
+
+
+def cached_svg_features(args, cache, metrics, svg):
     """
-    Reads a rivers.csv, cleans Length, Width, Discharge columns (removes units, converts to float),
-    and writes the result to a new CSV.
+    Cleaned land and river features for the SVG, extracted again only when
+    the SVG or the geometry options changed since a cached run.
     """
-    with open(input_file, "r", newline="", encoding="utf-8") as infile, open(
-        output_file, "w", newline="", encoding="utf-8"
-    ) as outfile:
-
-        reader = csv.DictReader(infile)
-        fieldnames = reader.fieldnames
-        if fieldnames is None:
-            raise ValueError("fieldnames must not be None")
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for row in reader:
-            if "Length" in row:
-                row["Length"] = extract_km(row["Length"])
-            if "Width" in row:
-                row["Width"] = extract_km(row["Width"])
-            if "Discharge" in row:
-                row["Discharge"] = extract_cms(row["Discharge"])
-            writer.writerow(row)
-    logger.info(f"Cleaned rivers csv: {input_file} -> {output_file}")
+    if cache is None:
+        return extract_svg_features(args, metrics, svg)
+
+    outputs = [
+        intermediate_path(args, LAND_OUTPUT_FILE),
+        intermediate_path(args, RIVERS_OUTPUT_FILE),
+    ]
+    config = {
+        "densify_tolerance": args.densify_tolerance,
+        "simplify_tolerance": args.simplify_tolerance,
+        "svg_height": SVG_HEIGHT,
+        "intermediate": args.intermediate,
+    }
+    key = cache.key("svg", [svg], config)
+    entry = cache.entry(key)
+    if entry is None:
+        land_features, river_features = extract_svg_features(args, metrics, svg)
+        if args.load and not args.cache_loaded_features:
+            # The features go straight to the database; caching them would
+            # bring back the second full write of the geometry
+            return land_features, river_features
+        cache.store(
+            key,
+            features={
+                os.path.basename(path): feats
+                for path, feats in zip(outputs, (land_features, river_features))
+            },
+        )
+        return land_features, river_features
+
+    logger.info(f"Stage cache hit for {svg}, skipping extraction")
+    if not args.load:
+        cache.restore(key, outputs)
+    return tuple(
+        list(iter_features(os.path.join(entry, os.path.basename(path))))
+        for path in outputs
+    )
 
 
 # ===========================
 # Main Script Logic
 # ===========================
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract and clean FMG exports.")
+    parser.add_argument(
+        "--zip",
+        default=None,
+        help="Read the export straight from this FMG zip instead of files "
+        "extracted into --data-dir.",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=DATA_DIR,
+        help=f"Directory of the extracted export and of the files this script "
+        f"writes; with --zip only the latter, e.g. a per-version scratch "
+        f"directory (default: {DATA_DIR}).",
+    )
+    parser.add_argument(
+        "--intermediate",
+        choices=INTERMEDIATE_FORMATS,
+        default="geojson",
+        help="Format of the cleaned land/river/cells/markers/routes files: "
+        "compact GeoJSON, or GeoParquet (WKB geometries and typed property "
+        "columns, needs pyarrow) (default: geojson).",
+    )
+    parser.add_argument(
+        "--densify-tolerance",
+        type=float,
+        default=None,
+        help="Flatten SVG curves so the chord error is at most this many pixels "
+        "(default: keep segment endpoints only).",
+    )
+    parser.add_argument(
+        "--simplify-tolerance",
+        type=float,
+        default=None,
+        help="Douglas-Peucker tolerance in pixels applied to land and river "
+        "geometries before they are written (default: no simplification).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes for the geometry stages (0 = one per CPU, default: 1).",
+    )
+    parser.add_argument(
+        "--load",
+        action="store_true",
+        help="COPY land, rivers, routes and cells straight into PostGIS instead "
+        "of writing the land/river GeoJSON files, then run "
+        "04_bulk_attribute_import.sql.",
+    )
+    parser.add_argument(
+        "--db-workers",
+        type=int,
+        default=DB_WORKERS,
+        help=f"Connections used for independent import steps with --load "
+        f"(default: {DB_WORKERS}).",
+    )
+    parser.add_argument(
+        "--swap-version",
+        default=None,
+        help="With --load, import into a staging schema spatial_<version> and "
+        "swap it in atomically when done (implies skipping 01_spatial_schema.sql "
+        "on the live schema).",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="With --load, only upsert features and attribute rows whose content "
+        "hash changed since the last import and delete the ones that are gone.",
+    )
+    parser.add_argument(
+        "--tiles",
+        nargs="?",
+        const=TILES_FILE,
+        default=None,
+        help=f"With --load, pre-render the vector tile pyramid into this MBTiles "
+        f"file afterwards, re-rendering only tiles with changed features "
+        f"(default file: {TILES_FILE}).",
+    )
+    parser.add_argument(
+        "--run-id",
+        default=None,
+        help="Identifies this run in the metrics file (default: a timestamp).",
+    )
+    parser.add_argument(
+        "--prom-dir",
+        default=PROM_TEXTFILE_DIR,
+        help="Write per-stage timings and row counts as a Prometheus textfile "
+        "into this directory (default: $PROM_TEXTFILE_DIR, unset = off).",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=PROFILE_DIR,
+        help="Dump a cProfile of the run into this directory "
+        "(default: $PROFILE_DIR, unset = off).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Always run every stage instead of reusing outputs cached in "
+        f"{CACHE_DIR} for identical inputs.",
+    )
+    parser.add_argument(
+        "--cache-loaded-features",
+        action="store_true",
+        help="With --load, also store the extracted land/river features in the "
+        "stage cache. Off by default: it writes all of that geometry a second "
+        "time just for a later cache hit.",
+    )
+    parser.add_argument(
+        "--pg-url",
+        default=os.environ.get("PG_DB_URL"),
+        help="Connection string for --load (default: $PG_DB_URL).",
+    )
+    args = parser.parse_args(argv)
+    if args.load and not args.pg_url:
+        parser.error("--load needs --pg-url or PG_DB_URL")
+    if args.swap_version and not args.load:
+        parser.error("--swap-version needs --load")
+    if args.delta and (not args.load or args.swap_version):
+        parser.error("--delta needs --load and cannot be combined with --swap-version")
+    if args.tiles and not args.load:
+        parser.error("--tiles needs --load")
+    if args.intermediate == "geoparquet":
+        try:
+            require_pyarrow()
+        except RuntimeError as e:
+            parser.error(str(e))
+    if args.workers <= 0:
+        args.workers = os.cpu_count() or 1
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics = Metrics("import", args.run_id)
+    archive = None
     try:
-        logger.info(f"Parsing SVG file: {SVG_FILE}")
-        with open(SVG_FILE, "r", encoding="utf-8") as f:
-            svg_content = f.read()
-        root = ET.fromstring(svg_content)
-
-        land_polys, freshwater_polys = extract_land_and_freshwater(root)
-        land_features = make_land_features(land_polys, freshwater_polys)
-
-        # Write land GeoJSON
-        land_fc = geojson.FeatureCollection(land_features)
-        with open(LAND_OUTPUT_FILE, "w") as f:
-            geojson.dump(land_fc, f, indent=2)
-        logger.info(f"Exported land features to {LAND_OUTPUT_FILE}")
-
-        river_features = extract_river_paths(root)
-        with open(RIVERS_OUTPUT_FILE, "w") as rf:
-            geojson.dump(geojson.FeatureCollection(river_features), rf, indent=2)
-        logger.info(f"Exported rivers to {RIVERS_OUTPUT_FILE}")
-
-        for fname in FILES_TO_CLEAN:
-            clean_file(fname)
-
-        validate_geojson_file(LAND_OUTPUT_FILE, {"Polygon", "MultiPolygon"})
-        validate_geojson_file(RIVERS_OUTPUT_FILE, {"LineString"})
-
-        clean_rivers_csv(
-            os.path.join(DATA_DIR, "rivers.csv"),
-            os.path.join(DATA_DIR, "rivers_cleaned.csv"),
-        )
-        clean_markers_csv(
-            os.path.join(DATA_DIR, "markers.csv"),
-            os.path.join(DATA_DIR, "markers_cleaned.csv"),
-        )
-
+        os.makedirs(args.data_dir, exist_ok=True)
+        archive = ZipSource(args.zip) if args.zip else None
+        with profiled("extract_and_clean", args.profile_dir):
+            run(args, metrics, archive)
         print("Cleaning completed successfully.")
         return 0
 
@@ -335,6 +654,119 @@ def main():
         print("Returning 1 from main()")
         return 1
 
+    finally:
+        if archive is not None:
+            archive.close()
+        metrics.write_prometheus(args.prom_dir)
+
+
+def run(args, metrics, archive=None):
+    """
+    The pipeline. Inputs come from `archive` (a ZipSource of --zip) when
+    given, else from --data-dir; everything written goes to --data-dir.
+    """
+    cache = None if args.no_cache else StageCache()
+    svg = input_source(args, archive, os.path.basename(SVG_FILE))
+    with metrics.stage("svg_features"):
+        land_features, river_features = cached_svg_features(args, cache, metrics, svg)
+
+    for fname in FILES_TO_CLEAN:
+        name = os.path.basename(fname)
+        source = input_source(args, archive, name)
+        outfile = intermediate_path(args, name)
+        with metrics.stage(f"clean:{name}"):
+            cached_stage(
+                cache,
+                "clean",
+                [source],
+                [outfile],
+                partial(clean_file, source, outfile),
+                {"intermediate": args.intermediate},
+            )
+
+    cells_file = intermediate_path(args, "cells.geojson")
+    graph_file = output_path(args, CELL_GRAPH_FILE)
+    with metrics.stage("cell_graph"):
+        cached_stage(
+            cache,
+            "cell_graph",
+            [cells_file],
+            [graph_file],
+            partial(write_cell_graph, cells_file, graph_file),
+        )
+
+    for name, columns in CSV_COLUMNS.items():
+        source = input_source(args, archive, name)
+        cleaned = output_path(args, cleaned_name(name))
+        with metrics.stage(f"csv:{name}"):
+            cached_stage(
+                cache,
+                f"csv:{name}",
+                [source],
+                [cleaned],
+                partial(clean_csv, source, cleaned, columns),
+            )
+
+    if not args.load:
+        return
+
+    sources = {
+        "rivers": river_features,
+        "routes": iter_features(intermediate_path(args, "routes.geojson")),
+        "cells": iter_features(cells_file),
+        "land": land_features,
+    }
+    if os.path.exists(graph_file):
+        sources["cell_edges"] = load_csr(graph_file)
+    files = attr_sql_files(args)
+    with metrics.stage("import"):
+        if args.delta:
+            results = import_delta(
+                args.pg_url,
+                land_features,
+                river_features,
+                args.data_dir,
+                args.db_workers,
+                files=files,
+                intermediate=args.intermediate,
+            )
+        else:
+            if args.swap_version:
+                results = import_with_swap(
+                    args.pg_url,
+                    sources,
+                    args.swap_version,
+                    args.db_workers,
+                    files=files,
+                )
+            else:
+                results = run_import(
+                    args.pg_url, sources, workers=args.db_workers, files=files
+                )
+            # Baseline for the next --delta import
+            record_hashes(
+                args.pg_url,
+                land_features,
+                river_features,
+                args.data_dir,
+                files,
+                intermediate=args.intermediate,
+            )
+    print_results(results)
+    # Each import step (geometry COPY or attribute SQL block) as its own record
+    for name, (seconds, rows) in results.items():
+        metrics.record(f"sql:{name}", seconds=round(seconds, 4), rows=rows)
+    with metrics.stage("row_counts"):
+        for table, rows in table_row_counts(args.pg_url).items():
+            metrics.record(f"table:{table}", rows=rows)
+
+    if args.tiles:
+        # The extent comes from the SVG of this upload, not whatever sits in DATA_DIR
+        with open_source(svg, text=False) as f:
+            size = map_size(f)
+        with metrics.stage("tiles"):
+            render_pyramid(args.pg_url, args.tiles, workers=args.db_workers, size=size)
+
 
 if __name__ == "__main__":
     sys.exit(main())
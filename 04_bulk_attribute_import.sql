@@ -1,5 +1,8 @@
+-- "-- @step <name>" starts a block that import_scheduler.py can run on its own
+-- connection; "-- @after <step>" lists what must finish first. psql ignores both.
 SET search_path = spatial, regular, public;
 
+-- @step burgs
 DROP TABLE IF EXISTS burgsattr_staging;
 CREATE TEMP TABLE burgsattr_staging (
     "Id" INTEGER,
@@ -29,7 +32,7 @@ CREATE TEMP TABLE burgsattr_staging (
     "City Generator Link" TEXT
 );
 
-\copy burgsattr_staging FROM '/srv/data-loader/data/burgs.csv' DELIMITER ',' CSV HEADER;
+\copy burgsattr_staging FROM '/srv/data-loader/data/burgs_cleaned.csv' DELIMITER ',' CSV HEADER;
 
 INSERT INTO
     regular."BurgsAttr" (
@@ -114,6 +117,7 @@ SET
 
 ----------------------------------------------------------------
 -- Repeat for each attribute table:
+-- @step cultures
 -- Culture
 -- 1. Create a staging table matching your CSV header
 DROP TABLE IF EXISTS culture_staging;
@@ -133,7 +137,7 @@ CREATE TEMP TABLE culture_staging (
 );
 
 -- 2. Bulk load the CSV
-\copy culture_staging FROM '/srv/data-loader/data/cultures.csv' DELIMITER ',' CSV HEADER;
+\copy culture_staging FROM '/srv/data-loader/data/cultures_cleaned.csv' DELIMITER ',' CSV HEADER;
 
 -- 3. Upsert from staging into your full Culture table, mapping columns
 INSERT INTO
@@ -204,6 +208,7 @@ SET
     ON CONFLICT (id) DO UPDATE
     SET geom = EXCLUDED.geom;
 
+-- @step markers
 -- MarkersAttr
 -- 1. Drop staging table if exists
 DROP TABLE IF EXISTS markersattr_staging;
@@ -273,6 +278,7 @@ UPDATE
 SET
     geom = EXCLUDED.geom;
 
+-- @step provinces
 -- ProvincesAttr
 DROP TABLE IF EXISTS provincesattr_staging;
 
@@ -293,7 +299,7 @@ CREATE TEMP TABLE provincesattr_staging (
 );
 
 -- \copy CSV data into the temp table
-\copy provincesattr_staging FROM '/srv/data-loader/data/provinces.csv' DELIMITER ',' CSV HEADER;
+\copy provincesattr_staging FROM '/srv/data-loader/data/provinces_cleaned.csv' DELIMITER ',' CSV HEADER;
 
 -- Upsert from staging to target table
 INSERT INTO
@@ -348,6 +354,7 @@ FROM
     regular."ProvincesAttr"
 ON CONFLICT (id) DO UPDATE
 SET geom = EXCLUDED.geom;
+-- @step religions
 -- Religion
 DROP TABLE IF EXISTS religionsattr_staging;
 
@@ -365,7 +372,7 @@ CREATE TEMP TABLE religionsattr_staging (
     expansionism DOUBLE PRECISION
 );
 
-\copy religionsattr_staging ( id, name, color, type, form, supreme_deity, area_km2, believers, origins, potential, expansionism) FROM '/srv/data-loader/data/religions.csv' DELIMITER ',' CSV HEADER;
+\copy religionsattr_staging ( id, name, color, type, form, supreme_deity, area_km2, believers, origins, potential, expansionism) FROM '/srv/data-loader/data/religions_cleaned.csv' DELIMITER ',' CSV HEADER;
 
 INSERT INTO
     regular."Religion" (
@@ -438,6 +445,7 @@ FROM
 ON CONFLICT (id) DO UPDATE
 SET geom = EXCLUDED.geom;
 
+-- @step rivers
 -- RiversAttr
 -- Drop temp staging table if it exists
 DROP TABLE IF EXISTS rivers_staging;
@@ -464,12 +472,13 @@ FROM rivers_staging
 ON CONFLICT (id) DO UPDATE
 SET name = EXCLUDED.name;
 
+-- @step routes
 -- RoutesAttr
 DROP TABLE IF EXISTS routesattr_staging;
 
 CREATE TEMP TABLE routesattr_staging (id INT, route TEXT, group_col TEXT, length TEXT);
 
-\copy routesattr_staging (id, route, group_col, length) FROM '/srv/data-loader/data/routes.csv' DELIMITER ',' CSV HEADER;
+\copy routesattr_staging (id, route, group_col, length) FROM '/srv/data-loader/data/routes_cleaned.csv' DELIMITER ',' CSV HEADER;
 
 INSERT INTO
     regular."RoutesAttr" (id, name, group_name)
@@ -493,24 +502,28 @@ FROM
 ON CONFLICT (id) DO UPDATE
 SET geom = EXCLUDED.geom;
 
+-- @step landmass
+-- @after load:land
 -- Landmass upsert from staging
 INSERT INTO spatial.landmass (id, geom, type)
 SELECT
   id,
-  ST_SetSRID(geom, 0),
+  geom,
   type
 FROM spatial.landmass_staging
 ON CONFLICT (id) DO UPDATE
 SET
-  geom = ST_SetSRID(EXCLUDED.geom, 0),
+  geom = EXCLUDED.geom,
   type = EXCLUDED.type;
 
+-- @step cells
+-- @after load:cells
 -- Cells upsert from staging
 INSERT INTO spatial.cells_geom (id, geom, geojsondata)
 SELECT
     id,
     geom,
-    NULL
+    geojsondata
 FROM
     spatial.cells_geom_staging
 ON CONFLICT (id) DO UPDATE
@@ -518,6 +531,8 @@ SET
     geom = EXCLUDED.geom,
     geojsondata = EXCLUDED.geojsondata;
 
+-- @step cells_attr
+-- @after load:cells
 -- Cells attribute upsert
 DROP TABLE IF EXISTS cellsattr_staging;
 
@@ -559,7 +574,7 @@ SELECT
         )) AS INTEGER)
     ),
     geojsondata
-FROM spatial.cells_geom
+FROM spatial.cells_geom_staging
 WHERE geojsondata->>'id' IS NOT NULL
 ON CONFLICT (id) DO UPDATE
 SET
@@ -572,4 +587,109 @@ SET
     culture = EXCLUDED.culture,
     religion = EXCLUDED.religion,
     neighbors = EXCLUDED.neighbors,
-    geojsondata = EXCLUDED.geojsondata;
\ No newline at end of file
+    geojsondata = EXCLUDED.geojsondata;
+
+----------------------------------------------------------------
+-- Region outlines: dissolve the cells of each biome/culture/province/
+-- religion/state into one MultiPolygon per id, once per import. These come
+-- after the attribute steps above, whose NULL placeholder rows they replace.
+
+-- @step dissolve_biomes
+-- @after cells, cells_attr
+INSERT INTO spatial.biomes_geom (id, geom)
+SELECT
+    a.biome,
+    ST_Multi(ST_Union(c.geom))
+FROM spatial.cells_geom c
+JOIN regular."CellsAttr" a ON a.id = c.id
+WHERE a.biome IS NOT NULL
+  AND c.geom IS NOT NULL
+GROUP BY a.biome
+ON CONFLICT (id) DO UPDATE
+SET geom = EXCLUDED.geom;
+
+-- Ids that no longer own any cell
+UPDATE spatial.biomes_geom g
+SET geom = NULL
+WHERE g.geom IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM regular."CellsAttr" a WHERE a.biome = g.id);
+
+-- @step dissolve_cultures
+-- @after cells, cells_attr, cultures
+INSERT INTO spatial.cultures_geom (id, geom)
+SELECT
+    a.culture,
+    ST_Multi(ST_Union(c.geom))
+FROM spatial.cells_geom c
+JOIN regular."CellsAttr" a ON a.id = c.id
+WHERE a.culture IS NOT NULL
+  AND c.geom IS NOT NULL
+GROUP BY a.culture
+ON CONFLICT (id) DO UPDATE
+SET geom = EXCLUDED.geom;
+
+-- Ids that no longer own any cell
+UPDATE spatial.cultures_geom g
+SET geom = NULL
+WHERE g.geom IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM regular."CellsAttr" a WHERE a.culture = g.id);
+
+-- @step dissolve_provinces
+-- @after cells, cells_attr, provinces
+INSERT INTO spatial.provinces_geom (id, geom)
+SELECT
+    a.province,
+    ST_Multi(ST_Union(c.geom))
+FROM spatial.cells_geom c
+JOIN regular."CellsAttr" a ON a.id = c.id
+WHERE a.province IS NOT NULL
+  AND c.geom IS NOT NULL
+GROUP BY a.province
+ON CONFLICT (id) DO UPDATE
+SET geom = EXCLUDED.geom;
+
+-- Ids that no longer own any cell
+UPDATE spatial.provinces_geom g
+SET geom = NULL
+WHERE g.geom IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM regular."CellsAttr" a WHERE a.province = g.id);
+
+-- @step dissolve_religions
+-- @after cells, cells_attr, religions
+INSERT INTO spatial.religions_geom (id, geom)
+SELECT
+    a.religion,
+    ST_Multi(ST_Union(c.geom))
+FROM spatial.cells_geom c
+JOIN regular."CellsAttr" a ON a.id = c.id
+WHERE a.religion IS NOT NULL
+  AND c.geom IS NOT NULL
+GROUP BY a.religion
+ON CONFLICT (id) DO UPDATE
+SET geom = EXCLUDED.geom;
+
+-- Ids that no longer own any cell
+UPDATE spatial.religions_geom g
+SET geom = NULL
+WHERE g.geom IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM regular."CellsAttr" a WHERE a.religion = g.id);
+
+-- @step dissolve_states
+-- @after cells, cells_attr
+INSERT INTO spatial.states_geom (id, geom)
+SELECT
+    a.state,
+    ST_Multi(ST_Union(c.geom))
+FROM spatial.cells_geom c
+JOIN regular."CellsAttr" a ON a.id = c.id
+WHERE a.state IS NOT NULL
+  AND c.geom IS NOT NULL
+GROUP BY a.state
+ON CONFLICT (id) DO UPDATE
+SET geom = EXCLUDED.geom;
+
+-- Ids that no longer own any cell
+UPDATE spatial.states_geom g
+SET geom = NULL
+WHERE g.geom IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM regular."CellsAttr" a WHERE a.state = g.id);
@@ -0,0 +1,404 @@
+"""
+Benchmark suite: generates a synthetic map per scale tier and times each step
+of 02_extract_and_clean.py and the geom_utils functions behind them on it,
+optionally followed by the database load. Results are written as JSON, one
+file per run, so runs of different versions can be compared.
+
+The database load drops and recreates the tables of 01_spatial_schema.sql,
+so only point --pg-url at a throwaway PostGIS database, e.g.
+    docker run --rm -e POSTGRES_PASSWORD=bench -p 5433:5432 postgis/postgis
+
+Usage: python benchmarks/run_benchmarks.py [--tier small|medium|large ...]
+       [--cells N] [--repeat N] [--workers N] [--pg-url URL]
+       [--output-dir DIR] [--compare RESULTS.json]
+"""
+
+import argparse
+import copy
+import importlib
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.metadata import PackageNotFoundError, version
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import csv_clean
+import geom_utils
+from cell_graph import load_csr, write_cell_graph
+from geojson_utils import feature_writer, iter_features
+from geoparquet import PARQUET_EXTENSION, pa
+from metrics import peak_rss_bytes
+from pg_loader import LOAD_TARGETS, iter_copy_rows
+from synthetic_map import TIERS, generate_map
+
+clean = importlib.import_module("02_extract_and_clean")
+
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+SCHEMA_SQL = os.path.join(REPO_DIR, "01_spatial_schema.sql")
+# Where 04_bulk_attribute_import.sql's \copy lines read from
+SQL_DATA_DIR = "/srv/data-loader/data"
+PACKAGES = ["numpy", "shapely", "svgpathtools", "geojson", "psycopg2-binary", "pyarrow"]
+# GeoParquet only where the optional pyarrow is installed
+INTERMEDIATE_EXTENSIONS = [".geojson"] + ([PARQUET_EXTENSION] if pa else [])
+DENSIFY_TOLERANCE = 0.5
+SIMPLIFY_TOLERANCE = 0.2
+REGRESSION_THRESHOLD = 1.10  # Flag steps that got this much slower in --compare
+
+
+def best_of(func, setup=None, repeat=3):
+    """
+    Best wall time of func() over `repeat` runs, with setup() (not timed)
+    before each. Returns (seconds, result of the last run).
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class Suite:
+    """Runs the benchmarks of one tier and collects their timings."""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+
+    def bench(self, name, func, setup=None, repeat=None):
+        seconds, result = best_of(func, setup, repeat or self.repeat)
+        self.results[name] = {
+            "seconds": round(seconds, 6),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+        print(f"  {name:<48} {seconds * 1000:>10.1f} ms")
+        return result
+
+
+def write_features(path, features):
+    with feature_writer(path) as writer:
+        writer.write_many(features)
+
+
+def restore(src_dir, dst_dir, *names):
+    """Setup for steps that rewrite their input in place."""
+
+    def setup():
+        for name in names:
+            shutil.copyfile(os.path.join(src_dir, name), os.path.join(dst_dir, name))
+
+    return setup
+
+
+def run_tier(tier, cells, work_dir, repeat, workers, pg_url=None):
+    pristine = os.path.join(work_dir, "generated")
+    data = os.path.join(work_dir, "data")
+    os.makedirs(data, exist_ok=True)
+    start = time.perf_counter()
+    counts = generate_map(pristine, cells)
+    generate_seconds = time.perf_counter() - start
+    restore(pristine, data, *os.listdir(pristine))()
+    print(f"{tier}: {counts['cells']} cells, generated in {generate_seconds:.1f}s")
+
+    suite = Suite(repeat)
+    bench = suite.bench
+    svg = os.path.join(data, "openheim.svg")
+    join = lambda name: os.path.join(data, name)  # noqa: E731
+
+    # 02: SVG extraction, in pipeline order
+    land_paths, freshwater_paths, river_paths = bench(
+        "02.iter_svg_paths", lambda: clean.iter_svg_paths(svg)
+    )
+    land_polys, freshwater_polys = bench(
+        "02.extract_land_and_freshwater",
+        lambda: clean.extract_land_and_freshwater(
+            land_paths, freshwater_paths, DENSIFY_TOLERANCE, workers
+        ),
+    )
+    land_features = bench(
+        "02.make_land_features",
+        lambda: clean.make_land_features(
+            land_polys, freshwater_polys, SIMPLIFY_TOLERANCE, workers
+        ),
+    )
+    river_features = bench(
+        "02.extract_river_paths",
+        lambda: clean.extract_river_paths(
+            river_paths, DENSIFY_TOLERANCE, SIMPLIFY_TOLERANCE, workers
+        ),
+    )
+    bench(
+        "02.clean_and_validate:land",
+        lambda: clean.clean_and_validate(
+            copy.deepcopy(land_features),
+            join("openheim_land_cleaned.geojson"),
+            ["Polygon", "MultiPolygon"],
+        ),
+    )
+    bench(
+        "02.clean_validate_and_write:rivers",
+        lambda: clean.clean_validate_and_write(
+            copy.deepcopy(river_features),
+            join("openheim_rivers_cleaned.geojson"),
+            ["LineString", "MultiLineString"],
+        ),
+    )
+
+    # 02: file cleaning, each run on a fresh copy of the generated file
+    for name in ("cells.geojson", "markers.geojson", "routes.geojson"):
+        bench(
+            f"02.clean_file:{name}",
+            lambda: clean.clean_file(join(name)),
+            restore(pristine, data, name),
+        )
+    bench(
+        "02.validate_geojson_file:cells",
+        lambda: clean.validate_geojson_file(
+            join("cells.geojson"), ["Polygon", "MultiPolygon"]
+        ),
+    )
+    for name, columns in csv_clean.CSV_COLUMNS.items():
+        bench(
+            f"csv_clean.clean_csv:{name}",
+            lambda: csv_clean.clean_csv(
+                join(name), join(csv_clean.cleaned_name(name)), columns
+            ),
+        )
+    bench(
+        "cell_graph.write_cell_graph",
+        lambda: write_cell_graph(join("cells.geojson"), join("cell_graph.npz")),
+    )
+
+    # Intermediate formats (--intermediate): the cleaned cells written, and
+    # read back into the COPY rows pg_loader streams to PostGIS
+    cells_features = list(iter_features(join("cells.geojson")))
+    for ext in INTERMEDIATE_EXTENSIONS:
+        path = join(f"cells_intermediate{ext}")
+        bench(
+            f"intermediate.write:{ext[1:]}",
+            lambda: write_features(path, cells_features),
+        )
+        suite.results[f"intermediate.write:{ext[1:]}"]["bytes"] = os.path.getsize(path)
+        bench(
+            f"intermediate.copy_rows:{ext[1:]}",
+            lambda: sum(
+                len(chunk)
+                for chunk in iter_copy_rows(iter_features(path), LOAD_TARGETS["cells"])
+            ),
+        )
+    del cells_features
+
+    # geom_utils on the same data, outside of the 02 wrappers
+    land_d = [d for _, d in land_paths]
+    bench(
+        "geom_utils.svg_paths_to_coords", lambda: geom_utils.svg_paths_to_coords(land_d)
+    )
+    bench(
+        "geom_utils.svg_paths_to_coords:densify",
+        lambda: geom_utils.svg_paths_to_coords(land_d, DENSIFY_TOLERANCE),
+    )
+    land_geoms = [poly for _, poly in land_polys]
+    freshwater_geoms = [poly for _, poly in freshwater_polys]
+    freshwater_array = np.asarray(freshwater_geoms, dtype=object)
+    groups = bench(
+        "geom_utils.intersecting_groups",
+        lambda: geom_utils.intersecting_groups(land_geoms, freshwater_geoms),
+    )
+    bench(
+        "geom_utils.subtract_groups",
+        lambda: geom_utils.subtract_groups(
+            land_geoms, [freshwater_array[g] for g in groups]
+        ),
+    )
+    bench(
+        "geom_utils.simplify_geometries",
+        lambda: geom_utils.simplify_geometries(land_geoms, SIMPLIFY_TOLERANCE),
+    )
+    cells_features = list(iter_features(join("cells.geojson")))
+    # Flipping twice restores the input, so the runs need no copies
+    bench(
+        "geom_utils.flip_y_coords_in_features:cells",
+        lambda: geom_utils.flip_y_coords_in_features(cells_features, clean.SVG_HEIGHT),
+    )
+    cell_ids = [f"cell{feat['properties']['id']}" for feat in cells_features]
+    del cells_features
+    bench(
+        "geom_utils.clean_id:cells",
+        lambda: [geom_utils.clean_id(val) for val in cell_ids],
+    )
+    river_ids = [f"river{i}" for i in range(counts["rivers"])]
+    bench(
+        "geom_utils.strip_river_prefix_and_make_int",
+        lambda: [geom_utils.strip_river_prefix_and_make_int(v) for v in river_ids],
+    )
+    marker_ids = [f"marker{i}" for i in range(counts["markers"])]
+    bench(
+        "geom_utils.strip_marker_prefix_and_make_int",
+        lambda: [geom_utils.strip_marker_prefix_and_make_int(v) for v in marker_ids],
+    )
+
+    if pg_url:
+        bench_db_load(suite, pg_url, data, land_features, river_features, workers)
+
+    return {
+        "counts": counts,
+        "generate_seconds": round(generate_seconds, 3),
+        "benchmarks": suite.results,
+    }
+
+
+def bench_db_load(suite, pg_url, data, land_features, river_features, workers):
+    """Schema DDL, then the full import of the cleaned tier data, once each."""
+    from db_utils import close_pools
+    from import_scheduler import run_import
+    from stage_runner import run_sql_file
+
+    # The attribute SQL reads its CSVs from the tier's directory instead
+    files = {
+        os.path.join(SQL_DATA_DIR, name): os.path.join(data, name)
+        for name in os.listdir(data)
+    }
+    try:
+        suite.bench("db.schema", lambda: run_sql_file(pg_url, SCHEMA_SQL), repeat=1)
+        results = suite.bench(
+            "db.run_import",
+            lambda: run_import(
+                pg_url,
+                {
+                    "rivers": river_features,
+                    "routes": iter_features(os.path.join(data, "routes.geojson")),
+                    "cells": iter_features(os.path.join(data, "cells.geojson")),
+                    "land": land_features,
+                    "cell_edges": load_csr(os.path.join(data, "cell_graph.npz")),
+                },
+                workers=workers,
+                files=files,
+            ),
+            repeat=1,
+        )
+    finally:
+        close_pools()
+    for name, (seconds, rows) in results.items():
+        suite.results[f"db.step:{name}"] = {"seconds": round(seconds, 6), "rows": rows}
+
+
+def environment():
+    def package_version(name):
+        try:
+            return version(name)
+        except PackageNotFoundError:
+            return None
+
+    try:
+        revision = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = "unknown"
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": {name: package_version(name) for name in PACKAGES},
+    }
+
+
+def compare(previous, current):
+    """Prints the change of every benchmark present in both runs."""
+    print(f"\nCompared with {previous['environment']['revision']}:")
+    for tier, result in current["tiers"].items():
+        before = previous["tiers"].get(tier, {}).get("benchmarks", {})
+        for name, entry in result["benchmarks"].items():
+            if name not in before or not before[name]["seconds"]:
+                continue
+            ratio = entry["seconds"] / before[name]["seconds"]
+            flag = "  SLOWER" if ratio > REGRESSION_THRESHOLD else ""
+            print(f"  {tier:<8} {name:<48} {ratio:>6.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--tier", choices=TIERS, action="append", help="Repeatable, default small"
+    )
+    parser.add_argument(
+        "--cells", type=int, help="Run one custom tier with this many cells"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--pg-url", help="Throwaway PostGIS database for the load benchmark"
+    )
+    parser.add_argument("--output-dir", default=RESULTS_DIR)
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument(
+        "--work-dir", help="Keep the generated maps here instead of a temp dir"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    tiers = (
+        {"custom": args.cells}
+        if args.cells
+        else {tier: TIERS[tier] for tier in args.tier or ["small"]}
+    )
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "settings": {
+            "repeat": args.repeat,
+            "workers": args.workers,
+            "densify_tolerance": DENSIFY_TOLERANCE,
+            "simplify_tolerance": SIMPLIFY_TOLERANCE,
+            "db": bool(args.pg_url),
+        },
+        "tiers": {},
+    }
+    work_root = args.work_dir or tempfile.mkdtemp(prefix="fmg-bench-")
+    try:
+        for tier, cells in tiers.items():
+            report["tiers"][tier] = run_tier(
+                tier,
+                cells,
+                os.path.join(work_root, tier),
+                args.repeat,
+                args.workers,
+                args.pg_url,
+            )
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(
+        args.output_dir,
+        f"{time.strftime('%Y%m%dT%H%M%S')}-{report['environment']['revision']}.json",
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""
+Generates a synthetic FMG-style export: the SVG (land mask, freshwater <use>
+references, river paths), cells/markers/routes/rivers GeoJSON and every CSV
+the watcher requires, at a chosen number of cells. The numbers of islands,
+lakes, rivers and the rest scale with the cell count unless given.
+
+Usage: python benchmarks/synthetic_map.py OUT_DIR [--tier small|medium|large]
+       [--cells N] [--islands N] [--lakes N] [--rivers N] [--seed N] [--zip]
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import zipfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cells per tier
+TIERS = {"small": 10_000, "medium": 100_000, "large": 1_000_000}
+SVG_WIDTH = 2000
+SVG_HEIGHT = 2000  # Same as SVG_HEIGHT in 02_extract_and_clean.py
+N_BIOMES = 13
+ISLAND_POINTS = 24  # Vertices of an island outline (one cubic curve each)
+LAKE_POINTS = 12
+RIVER_SEGMENTS = 8
+
+
+def default_counts(cells):
+    """Feature counts of a map with `cells` cells, roughly in FMG's proportions."""
+    return {
+        "cells": cells,
+        "islands": max(1, cells // 1000),
+        "lakes": max(1, cells // 500),
+        "rivers": max(1, cells // 100),
+        "markers": max(1, cells // 200),
+        "routes": max(1, cells // 100),
+        "burgs": max(1, cells // 50),
+        "states": max(2, cells // 2000),
+        "provinces": max(4, cells // 500),
+        "cultures": max(2, cells // 5000),
+        "religions": max(2, cells // 5000),
+    }
+
+
+def _blob(rng, cx, cy, radius, points):
+    """Closed SVG path of cubic curves through a jittered circle."""
+    angles = np.linspace(0, 2 * math.pi, points, endpoint=False)
+    radii = radius * rng.uniform(0.7, 1.2, points)
+    xs = (cx + radii * np.cos(angles)).round(2)
+    ys = (cy + radii * np.sin(angles)).round(2)
+    d = [f"M{xs[0]},{ys[0]}"]
+    for i in range(1, points + 1):
+        (ax, ay), (bx, by) = (xs[i - 1], ys[i - 1]), (xs[i % points], ys[i % points])
+        d.append(
+            f"C{ax + (bx - ax) / 3:.2f},{ay + (by - ay) / 3:.2f},"
+            f"{bx - (bx - ax) / 3:.2f},{by - (by - ay) / 3:.2f},{bx},{by}"
+        )
+    return "".join(d) + "Z"
+
+
+def _river(rng, x, y, segments):
+    """Open SVG path meandering away from (x, y)."""
+    heading = rng.uniform(0, 2 * math.pi)
+    d = [f"M{x:.2f},{y:.2f}"]
+    for _ in range(segments):
+        heading += rng.uniform(-0.6, 0.6)
+        step = rng.uniform(5, 15)
+        nx, ny = x + step * math.cos(heading), y + step * math.sin(heading)
+        d.append(
+            f"C{x + (nx - x) / 3 + rng.uniform(-2, 2):.2f},"
+            f"{y + (ny - y) / 3 + rng.uniform(-2, 2):.2f},"
+            f"{nx - (nx - x) / 3:.2f},{ny - (ny - y) / 3:.2f},{nx:.2f},{ny:.2f}"
+        )
+        x, y = nx, ny
+    return "".join(d)
+
+
+def write_svg(path, rng, counts):
+    """Islands with lakes inside them, the land mask, freshwater group and rivers."""
+    # Island radius so that all islands together cover about a third of the map
+    radius = math.sqrt(SVG_WIDTH * SVG_HEIGHT / 3 / math.pi / counts["islands"])
+    centers = rng.uniform(
+        (radius, radius),
+        (SVG_WIDTH - radius, SVG_HEIGHT - radius),
+        (counts["islands"], 2),
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{SVG_WIDTH}" height="{SVG_HEIGHT}">\n<defs><g id="featurePaths">\n'
+        )
+        feature_id = 0
+        land, freshwater = [], []
+        for cx, cy in centers:
+            feature_id += 1
+            land.append(feature_id)
+            d = _blob(rng, cx, cy, radius, ISLAND_POINTS)
+            f.write(f'<path id="feature_{feature_id}" d="{d}"/>\n')
+        for i in range(counts["lakes"]):
+            cx, cy = centers[i % len(centers)] + rng.uniform(-0.4, 0.4, 2) * radius
+            feature_id += 1
+            freshwater.append(feature_id)
+            d = _blob(rng, cx, cy, radius * rng.uniform(0.05, 0.2), LAKE_POINTS)
+            f.write(f'<path id="feature_{feature_id}" d="{d}"/>\n')
+        f.write('</g>\n<mask id="land">\n')
+        f.write('<rect x="0" y="0" width="100%" height="100%" fill="black"/>\n')
+        for i in land:
+            f.write(f'<use xlink:href="#feature_{i}" fill="white"/>\n')
+        f.write('</mask></defs>\n<g id="viewbox"><g id="rivers">\n')
+        for i in range(counts["rivers"]):
+            x, y = centers[i % len(centers)] + rng.uniform(-0.5, 0.5, 2) * radius
+            d = _river(rng, x, y, RIVER_SEGMENTS)
+            f.write(f'<path id="river{i + 1}" d="{d}"/>\n')
+        f.write('</g>\n<g id="lakes"><g id="freshwater">\n')
+        for i in freshwater:
+            f.write(f'<use xlink:href="#feature_{i}"/>\n')
+        f.write("</g></g></g>\n</svg>\n")
+
+
+def _write_features(path, features):
+    """Streams (geometry, properties) pairs into a FeatureCollection."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"type":"FeatureCollection","features":[\n')
+        for i, (geometry, properties) in enumerate(features):
+            if i:
+                f.write(",\n")
+            f.write(
+                json.dumps(
+                    {"type": "Feature", "geometry": geometry, "properties": properties},
+                    separators=(",", ":"),
+                )
+            )
+        f.write("\n]}\n")
+
+
+def _cells(rng, counts):
+    """Quads over a jittered vertex lattice, so neighbors share their edges."""
+    nx = max(1, round(math.sqrt(counts["cells"] * SVG_WIDTH / SVG_HEIGHT)))
+    ny = max(1, -(-counts["cells"] // nx))
+    dx, dy = SVG_WIDTH / nx, SVG_HEIGHT / ny
+    xs, ys = np.meshgrid(np.arange(nx + 1) * dx, np.arange(ny + 1) * dy)
+    vertices = np.stack((xs, ys), axis=-1)
+    # Jitter inner vertices by less than a quarter cell so quads stay simple
+    vertices[1:-1, 1:-1] += rng.uniform(-0.25, 0.25, (ny - 1, nx - 1, 2)) * (dx, dy)
+    vertices = vertices.round(2).tolist()
+    heights = rng.integers(0, 100, counts["cells"]).tolist()
+    biomes = rng.integers(0, N_BIOMES, counts["cells"]).tolist()
+    population = rng.integers(0, 1000, counts["cells"]).tolist()
+    columns = {
+        name: rng.integers(0, counts[plural], counts["cells"]).tolist()
+        for name, plural in (
+            ("state", "states"),
+            ("province", "provinces"),
+            ("culture", "cultures"),
+            ("religion", "religions"),
+        )
+    }
+    for i in range(counts["cells"]):
+        row, col = divmod(i, nx)
+        ring = [
+            vertices[row][col],
+            vertices[row][col + 1],
+            vertices[row + 1][col + 1],
+            vertices[row + 1][col],
+            vertices[row][col],
+        ]
+        neighbors = [
+            j
+            for j, ok in (
+                (i - nx, row > 0),
+                (i + 1, col < nx - 1 and i + 1 < counts["cells"]),
+                (i + nx, i + nx < counts["cells"]),
+                (i - 1, col > 0),
+            )
+            if ok
+        ]
+        properties = {
+            "id": i,
+            "height": heights[i],
+            "biome": biomes[i],
+            "type": "island" if heights[i] >= 20 else "ocean",
+            "population": population[i],
+            **{name: values[i] for name, values in columns.items()},
+            "neighbors": neighbors,
+        }
+        yield {"type": "Polygon", "coordinates": [ring]}, properties
+
+
+def _point(rng):
+    return [round(rng.uniform(0, SVG_WIDTH), 2), round(rng.uniform(0, SVG_HEIGHT), 2)]
+
+
+def _line(rng, points):
+    x, y = _point(rng)
+    steps = rng.uniform(-20, 20, (points, 2)).cumsum(axis=0) + (x, y)
+    return steps.clip(0, (SVG_WIDTH, SVG_HEIGHT)).round(2).tolist()
+
+
+def _write_csv(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def write_csvs(out_dir, rng, counts):
+    """The attribute CSVs, with FMG's unit suffixes where the cleaners expect them."""
+    join = lambda name: os.path.join(out_dir, name)  # noqa: E731
+    _write_csv(
+        join("biomes.csv"),
+        ["Id", "Biome", "Color", "Habitability", "Cells", "Area km2", "Population"],
+        [[i, f"Biome {i}", "#88aa55", 50, 10, 100, 5] for i in range(N_BIOMES)],
+    )
+    _write_csv(
+        join("burgs.csv"),
+        [
+            "Id",
+            "Burg",
+            "Province",
+            "Province Full Name",
+            "State",
+            "State Full Name",
+            "Culture",
+            "Religion",
+            "Population",
+            "X",
+            "Y",
+            "Latitude",
+            "Longitude",
+            "Elevation (m)",
+            "Temperature",
+            "Temperature likeness",
+            "Capital",
+            "Port",
+            "Citadel",
+            "Walls",
+            "Plaza",
+            "Temple",
+            "Shanty Town",
+            "Emblem",
+            "City Generator Link",
+        ],  # fmt: skip
+        [
+            [
+                i + 1,
+                f"Burg {i + 1}",
+                "Province",
+                "Province of Burg",
+                "State",
+                "State of Burg",
+                "Culture",
+                "Religion",
+                int(rng.integers(100, 50000)),
+                *_point(rng),
+                round(rng.uniform(-90, 90), 4),
+                round(rng.uniform(-180, 180), 4),
+                int(rng.integers(0, 3000)),
+                "12°C",
+                "Average",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                "emblem",
+                "https://example.invalid/burg",
+            ]  # fmt: skip
+            for i in range(counts["burgs"])
+        ],
+    )
+    _write_csv(
+        join("cultures.csv"),
+        [
+            "Id",
+            "Name",
+            "Color",
+            "Cells",
+            "Expansionism",
+            "Type",
+            "Area km2",
+            "Population",
+            "Namesbase",
+            "Emblems Shape",
+            "Origins",
+        ],  # fmt: skip
+        [
+            [
+                i,
+                f"Culture {i}",
+                "#aa5588",
+                100,
+                1.0,
+                "Generic",
+                1000,
+                5000,
+                "Names",
+                "heater",
+                "",
+            ]  # fmt: skip
+            for i in range(counts["cultures"])
+        ],
+    )
+    _write_csv(
+        join("provinces.csv"),
+        [
+            "Id",
+            "Province",
+            "Full Name",
+            "Form",
+            "State",
+            "Color",
+            "Capital",
+            "Area km2",
+            "Total Population",
+            "Rural Population",
+            "Urban Population",
+            "Burgs",
+        ],  # fmt: skip
+        [
+            [
+                i,
+                f"Province {i}",
+                f"County of Province {i}",
+                "County",
+                "State",
+                "#5588aa",
+                "Burg",
+                1000,
+                300,
+                200,
+                100,
+                3,
+            ]  # fmt: skip
+            for i in range(counts["provinces"])
+        ],
+    )
+    _write_csv(
+        join("religions.csv"),
+        [
+            "Id",
+            "Name",
+            "Color",
+            "Type",
+            "Form",
+            "Supreme Deity",
+            "Area km2",
+            "Believers",
+            "Origins",
+            "Potential",
+            "Expansionism",
+        ],  # fmt: skip
+        [
+            [
+                i,
+                f"Religion {i}",
+                "#55aa88",
+                "Folk",
+                "Shamanism",
+                "Deity",
+                1000,
+                5000,
+                "",
+                "culture",
+                1.0,
+            ]  # fmt: skip
+            for i in range(counts["religions"])
+        ],
+    )
+    _write_csv(
+        join("rivers.csv"),
+        ["Id", "River", "Type", "Length", "Width", "Discharge", "Basin"],
+        [
+            [
+                i + 1,
+                f"River {i + 1}",
+                "River",
+                f"{rng.uniform(1, 500):.1f} km",
+                f"{int(rng.integers(10, 2000))} m",
+                f"{int(rng.integers(1, 10000))} m³/s",
+                "Basin",
+            ]
+            for i in range(counts["rivers"])
+        ],
+    )
+    _write_csv(
+        join("routes.csv"),
+        ["Id", "Route", "Group", "Length"],
+        [
+            [i, f"Route {i}", "roads", f"{int(rng.integers(1, 300))} km"]
+            for i in range(counts["routes"])
+        ],
+    )
+    _write_csv(
+        join("markers.csv"),
+        ["Id", "Type", "Icon", "Name", "Note", "X", "Y", "Latitude", "Longitude"],
+        [
+            [
+                f"marker{i}",
+                "inns",
+                "🍻",
+                f"Marker {i}",
+                "A note, with a comma",
+                *_point(rng),
+                round(rng.uniform(-90, 90), 4),
+                round(rng.uniform(-180, 180), 4),
+            ]  # fmt: skip
+            for i in range(counts["markers"])
+        ],
+    )
+
+
+def generate_map(out_dir, cells=TIERS["small"], seed=0, **overrides):
+    """
+    Writes a complete synthetic export into out_dir and returns the feature
+    counts used. Same arguments and seed, same files.
+    """
+    counts = default_counts(cells)
+    counts.update({k: v for k, v in overrides.items() if v is not None})
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    join = lambda name: os.path.join(out_dir, name)  # noqa: E731
+
+    write_svg(join("openheim.svg"), rng, counts)
+    _write_features(join("cells.geojson"), _cells(rng, counts))
+    _write_features(
+        join("markers.geojson"),
+        (
+            ({"type": "Point", "coordinates": _point(rng)}, {"id": f"marker{i}"})
+            for i in range(counts["markers"])
+        ),
+    )
+    _write_features(
+        join("routes.geojson"),
+        (
+            (
+                {"type": "LineString", "coordinates": _line(rng, 10)},
+                {"id": f"route{i}", "group": "roads", "feature": 1},
+            )
+            for i in range(counts["routes"])
+        ),
+    )
+    _write_features(
+        join("rivers.geojson"),
+        (
+            (
+                {"type": "LineString", "coordinates": _line(rng, RIVER_SEGMENTS)},
+                {"id": f"river{i + 1}"},
+            )
+            for i in range(counts["rivers"])
+        ),
+    )
+    write_csvs(out_dir, rng, counts)
+    return counts
+
+
+def write_zip(out_dir, zip_path):
+    """Packs the generated files like an FMG upload, e.g. for the watcher."""
+    from watcher import REQUIRED_FILES
+
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name in REQUIRED_FILES:
+            zf.write(os.path.join(out_dir, name), name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--tier", choices=TIERS, default="small")
+    parser.add_argument("--cells", type=int, help="Overrides the tier's cell count")
+    for name in ("islands", "lakes", "rivers", "markers", "routes", "burgs"):
+        parser.add_argument(f"--{name}", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--zip", action="store_true", help="Also write OUT_DIR/openheim.zip"
+    )
+    args = parser.parse_args()
+    overrides = {
+        name: getattr(args, name)
+        for name in ("islands", "lakes", "rivers", "markers", "routes", "burgs")
+    }
+    counts = generate_map(
+        args.out_dir, args.cells or TIERS[args.tier], args.seed, **overrides
+    )
+    if args.zip:
+        write_zip(args.out_dir, os.path.join(args.out_dir, "openheim.zip"))
+    print(", ".join(f"{name}: {n}" for name, n in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
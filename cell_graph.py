@@ -0,0 +1,148 @@
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from geojson_utils import iter_features
+from pg_loader import _PGCOPY_HEADER, _PGCOPY_TRAILER, DATA_DIR, SCHEMA
+
+logger = logging.getLogger(__name__)
+
+CELLS_FILE = os.path.join(DATA_DIR, "cells.geojson")
+CELL_GRAPH_FILE = os.path.join(DATA_DIR, "cell_graph.npz")
+EDGE_TABLE = "cell_edges"
+
+# One binary COPY row: field count, then length-prefixed int4 src and dst
+_EDGE_ROW = np.dtype(
+    [
+        ("fields", ">i2"),
+        ("src_len", ">i4"),
+        ("src", ">i4"),
+        ("dst_len", ">i4"),
+        ("dst", ">i4"),
+    ]
+)
+
+
+def _neighbors(props):
+    value = props.get("neighbors") or []
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value
+
+
+def build_csr(features):
+    """
+    Builds the cell adjacency graph in CSR form from the cells' "neighbors"
+    property: the neighbors of ids[i] are targets[offsets[i]:offsets[i + 1]],
+    sorted, without duplicates or self-loops. All arrays are int32. Cells
+    without an integer id (e.g. one clean_id could not parse) are left out
+    and logged.
+    """
+    ids, counts, targets = [], [], []
+    skipped = []
+    for i, feat in enumerate(features):
+        props = feat.get("properties") or {}
+        cell_id = props.get("id", feat.get("id"))
+        try:
+            cell_id = int(cell_id)
+        except (TypeError, ValueError):
+            skipped.append(i)
+            continue
+        neighbors = _neighbors(props)
+        ids.append(cell_id)
+        counts.append(len(neighbors))
+        targets.extend(neighbors)
+    if skipped:
+        logger.warning(
+            f"Cell graph: left out {len(skipped)} cells without an id "
+            f"(features {', '.join(map(str, skipped[:10]))}"
+            f"{', ...' if len(skipped) > 10 else ''})"
+        )
+
+    ids = np.asarray(ids, dtype=np.int32)
+    src = np.repeat(ids, counts)
+    dst = np.asarray(targets, dtype=np.int32)
+    edges = np.unique(np.column_stack((src, dst)), axis=0)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+
+    nodes = np.unique(ids)
+    offsets = np.append(np.searchsorted(edges[:, 0], nodes), len(edges))
+    return {
+        "ids": nodes,
+        "offsets": offsets.astype(np.int32),
+        "targets": np.ascontiguousarray(edges[:, 1], dtype=np.int32),
+    }
+
+
+def edge_arrays(graph):
+    """(src, dst) arrays with one entry per directed edge."""
+    return np.repeat(graph["ids"], np.diff(graph["offsets"])), graph["targets"]
+
+
+def save_csr(graph, path):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **graph)
+        # mkstemp creates 0600 files; keep the permissions of the file we replace
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        else:
+            os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_csr(path=CELL_GRAPH_FILE):
+    with np.load(path) as data:
+        return {name: data[name] for name in ("ids", "offsets", "targets")}
+
+
+def write_cell_graph(cells_file=CELLS_FILE, outfile=CELL_GRAPH_FILE):
+    if not os.path.exists(cells_file):
+        logger.warning(f"Cell graph skipped (file not found): {cells_file}")
+        return
+    graph = build_csr(iter_features(cells_file))
+    save_csr(graph, outfile)
+    logger.info(
+        f"Wrote cell graph with {len(graph['ids'])} cells and "
+        f"{len(graph['targets'])} edges to {outfile}"
+    )
+
+
+def copy_edges(cur, graph, schema=SCHEMA, truncate=True):
+    """Replaces {schema}.cell_edges with the graph's edges via binary COPY."""
+    src, dst = edge_arrays(graph)
+    rows = np.empty(len(src), dtype=_EDGE_ROW)
+    rows["fields"] = 2
+    rows["src_len"] = 4
+    rows["dst_len"] = 4
+    rows["src"] = src
+    rows["dst"] = dst
+
+    table = f"{schema}.{EDGE_TABLE}"
+    if truncate:
+        cur.execute(f"TRUNCATE {table}")
+    cur.copy_expert(
+        f"COPY {table} (src, dst) FROM STDIN WITH (FORMAT binary)",
+        io.BytesIO(_PGCOPY_HEADER + rows.tobytes() + _PGCOPY_TRAILER),
+    )
+    return cur.rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write the CSR cell adjacency graph from cells.geojson."
+    )
+    parser.add_argument("--cells", default=CELLS_FILE)
+    parser.add_argument("--out", default=CELL_GRAPH_FILE)
+    args = parser.parse_args()
+    write_cell_graph(args.cells, args.out)
@@ -1,23 +1,53 @@
-import psycopg2
+import os
+import threading
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
 from datetime import datetime, timezone
 
+DB_POOL_MAX = 4  # Connections kept open per database URL
+# Serializes version claims and status changes across watchers
+FILEUPLOAD_LOCK = 'regular."FileUpload"'
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(pg_url):
+    with _pools_lock:
+        pool = _pools.get(pg_url)
+        if pool is None:
+            pool = _pools[pg_url] = ThreadedConnectionPool(1, DB_POOL_MAX, pg_url)
+        return pool
 
-def get_next_version(pg_url, name):
-    with psycopg2.connect(pg_url) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT "version" FROM regular."FileUpload"
-                WHERE "name"=%s
-                ORDER BY "createdDate" DESC
-                LIMIT 1
-                """,
-                (name,),
-            )
-            row = cur.fetchone()
 
-    version_str = str(row[0]) if row and row[0] else "0.0.1"
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
 
+
+@contextmanager
+def connection(pg_url):
+    """
+    A pooled connection inside a transaction: committed when the block ends,
+    rolled back on an exception. Broken connections are not reused.
+    """
+    pool = get_pool(pg_url)
+    conn = pool.getconn()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+def _lock_fileupload(cur):
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (FILEUPLOAD_LOCK,))
+
+
+def _increment_version(version_str):
     try:
         parts = [int(p) for p in version_str.strip().split(".")]
         while len(parts) < 3:
@@ -31,31 +61,67 @@ def get_next_version(pg_url, name):
         return "0.0.1"
 
 
-def set_previous_active_to_passed(pg_url):
-    """Sets the currently active file (if any) to 'passed' and returns its version (if any)."""
-    with psycopg2.connect(pg_url) as conn:
+def _version_tuple(version_str):
+    """'0.0.12' -> (0, 0, 12); None for anything that is not a version."""
+    try:
+        parts = [int(p) for p in str(version_str).strip().split(".")]
+    except ValueError:
+        return None
+    return tuple((parts + [0, 0])[:3])
+
+
+def claim_next_version(pg_url, name, baseName, directory):
+    """
+    Picks the next version for an upload and records directory/<stem>_<version>.zip
+    with status 'uploaded' in the same transaction, under an advisory lock,
+    so two watchers never hand out the same version. Returns the version.
+
+    The highest version wins, not the newest row: failed uploads are recorded
+    without a version, so their version is read from the <stem>_<version>.zip
+    name instead.
+    """
+    stem = name[: -len(".zip")] if name.endswith(".zip") else name
+    with connection(pg_url) as conn:
         with conn.cursor() as cur:
-            # Get the version of the currently active file (if any)
+            _lock_fileupload(cur)
             cur.execute(
                 """
-                SELECT "version" FROM regular."FileUpload"
-                WHERE "status" = 'active'
-                ORDER BY "createdDate" DESC
-                LIMIT 1
-                """
+                SELECT "name", "version" FROM regular."FileUpload"
+                WHERE "name"=%s OR "name" LIKE %s
+                """,
+                (name, stem.replace("_", "\\_") + "\\_%.zip"),
             )
-            row = cur.fetchone()
-            version = row[0] if row else None
-
-            # Update status to 'passed'
-            cur.execute(
-                """
-                UPDATE regular."FileUpload"
-                SET "status" = 'passed'
-                WHERE "status" = 'active'
-                """
+            versions = [
+                _version_tuple(version)
+                or _version_tuple(row_name[len(stem) + 1 : -len(".zip")])
+                for row_name, version in cur.fetchall()
+            ]
+            latest = max((v for v in versions if v), default=None)
+            version = _increment_version(
+                ".".join(map(str, latest)) if latest else "0.0.1"
             )
-        conn.commit()
+            while True:
+                claimed = f"{stem}_{version}.zip"
+                cur.execute(
+                    """
+                    INSERT INTO regular."FileUpload" ("name", "baseName", "path", "version", "status", "createdDate")
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT ("name") DO NOTHING
+                    """,
+                    (
+                        claimed,
+                        baseName,
+                        os.path.join(directory, claimed),
+                        version,
+                        "uploaded",
+                        datetime.now(timezone.utc),
+                    ),
+                )
+                if cur.rowcount:
+                    break
+                # A row already owns this name; never reuse its version
+                print(f"{claimed} is already recorded, trying the next version")
+                version = _increment_version(version)
     return version
 
 
@@ -70,7 +136,7 @@ def insert_fileupload_entry(name, baseName, path, version, status, pg_url):
         f"\n  status: {status}"
         f"\n  created_date: {created_date}"
     )
-    with psycopg2.connect(pg_url) as conn:
+    with connection(pg_url) as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -80,43 +146,44 @@ def insert_fileupload_entry(name, baseName, path, version, status, pg_url):
                 """,
                 (name, baseName, path, version, status, created_date),
             )
-        conn.commit()
-
-
-def set_active_status(pg_url, name):
-    with psycopg2.connect(pg_url) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                UPDATE regular."FileUpload"
-                SET "status"=%s
-                WHERE "name"=%s AND "status"=%s
-                """,
-                ("active", name, "passed"),
-            )
-        conn.commit()
 
 
 def update_fileupload_status(path, baseName, name, status, version, pg_url):
+    """
+    Upserts the upload's row with the new status. Marking it 'active' also
+    demotes the previously active upload of the same map (baseName) to
+    'passed' in the same transaction.
+    """
     print(f"Next version for {name} is {version}")
     created_date = datetime.now(timezone.utc)
 
     print(f"Updating fileupload status for {name} to {status} with version {version}")
-    if status == "active":
-        set_active_status(pg_url, name)
-
-    with psycopg2.connect(pg_url) as conn:
+    with connection(pg_url) as conn:
         with conn.cursor() as cur:
+            _lock_fileupload(cur)
+            if status == "active":
+                # Only the same map's active upload; other maps keep theirs
+                cur.execute(
+                    """
+                    UPDATE regular."FileUpload"
+                    SET "status" = 'passed'
+                    WHERE "status" = 'active' AND "name" <> %s
+                      AND "baseName" = COALESCE(
+                          (SELECT "baseName" FROM regular."FileUpload" WHERE "name" = %s),
+                          %s
+                      )
+                    """,
+                    (name, name, baseName),
+                )
             cur.execute(
                 """
                 INSERT INTO regular."FileUpload" ("name", "baseName", "path", "version", "status", "createdDate")
                 VALUES (%s, %s, %s, %s, %s, %s)
                 ON CONFLICT ("name")
-                DO UPDATE SET "version" = EXCLUDED."version",
+                DO UPDATE SET "version" = COALESCE(EXCLUDED."version", regular."FileUpload"."version"),
                             "status" = EXCLUDED."status",
                             "createdDate" = EXCLUDED."createdDate";
                 """,
                 (name, baseName, path, version, status, created_date),
             )
-        conn.commit()
     return version
@@ -0,0 +1,285 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from functools import partial
+
+import psycopg2
+
+from cell_graph import CELL_GRAPH_FILE, load_csr
+from geojson_utils import iter_features
+from import_scheduler import ATTR_SQL, DB_WORKERS, run_import
+from pg_loader import DATA_DIR, LOAD_TARGETS, SCHEMA, target_path
+from zip_source import open_source, source_exists
+
+logger = logging.getLogger(__name__)
+
+HASH_TABLE = "regular.import_hashes"
+# Attribute CSVs that 04_bulk_attribute_import.sql \copy's, keyed by their Id column
+CSV_FILES = (
+    "burgs_cleaned.csv",
+    "markers_cleaned.csv",
+    "routes_cleaned.csv",
+    "rivers_cleaned.csv",
+)
+# Land parts have no stable id of their own, so land is hashed and reloaded as a whole
+WHOLE_KINDS = ("land",)
+# Where rows that disappeared from the export are deleted. burgs_geom and
+# burgs_pixel_geom follow BurgsAttr through ON DELETE CASCADE.
+DELETE_FROM = {
+    "cells": ["spatial.cells_geom", 'regular."CellsAttr"'],
+    "rivers": ["spatial.rivers_geom"],
+    "burgs_cleaned.csv": ['regular."BurgsAttr"'],
+    "markers_cleaned.csv": ["spatial.markers_geom", 'regular."MarkersAttr"'],
+    "routes_cleaned.csv": ["spatial.routes_geom", 'regular."RoutesAttr"'],
+    "rivers_cleaned.csv": ['regular."RiversAttr"'],
+}
+# Loaded straight into its final table, so changed rows are deleted and appended
+APPEND_SOURCES = ("rivers",)
+
+
+def content_hash(value):
+    return hashlib.sha1(
+        json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+def feature_key(feature):
+    props = feature.get("properties") or {}
+    return str(props.get("id", feature.get("id")))
+
+
+def hash_features(name, features):
+    if name in WHOLE_KINDS:
+        return {"all": content_hash([content_hash(f) for f in features])}
+    return {feature_key(f): content_hash(f) for f in features}
+
+
+def hash_csv(source):
+    with open_source(source) as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return {row[0]: content_hash(row) for row in reader if row}
+
+
+def csv_source(name, data_dir=DATA_DIR, files=None):
+    """
+    Where the attribute SQL reads `name` from: files[DATA_DIR/name] when
+    given (as for run_import), else the file in data_dir.
+    """
+    return (files or {}).get(os.path.join(DATA_DIR, name), os.path.join(data_dir, name))
+
+
+def compute_hashes(
+    land_features, river_features, data_dir=DATA_DIR, files=None, intermediate="geojson"
+):
+    """
+    {kind: {key: hash}} for the extracted features, the cells/routes files
+    (written as `intermediate`) and the attribute CSVs.
+    """
+    hashes = {
+        "land": hash_features("land", land_features),
+        "rivers": hash_features("rivers", river_features),
+    }
+    for name in ("cells", "routes"):
+        path = target_path(data_dir, LOAD_TARGETS[name], intermediate)
+        hashes[name] = hash_features(name, iter_features(path))
+    for name in CSV_FILES:
+        source = csv_source(name, data_dir, files)
+        if source_exists(source):
+            hashes[name] = hash_csv(source)
+    return hashes
+
+
+def ensure_hash_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {HASH_TABLE} (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+            """
+        )
+    conn.commit()
+
+
+def fetch_hashes(conn):
+    hashes = {}
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT kind, key, hash FROM {HASH_TABLE}")
+        for kind, key, value in cur:
+            hashes.setdefault(kind, {})[key] = value
+    return hashes
+
+
+def store_hashes(conn, hashes):
+    """Replaces the stored hashes with those of the import that just finished."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for kind, rows in hashes.items():
+        writer.writerows((kind, key, value) for key, value in rows.items())
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {HASH_TABLE}")
+        cur.copy_expert(
+            f"COPY {HASH_TABLE} (kind, key, hash) FROM STDIN WITH (FORMAT csv)", buf
+        )
+    conn.commit()
+    logger.info(f"Stored {sum(len(r) for r in hashes.values())} content hashes")
+
+
+def record_hashes(
+    pg_url,
+    land_features,
+    river_features,
+    data_dir=DATA_DIR,
+    files=None,
+    intermediate="geojson",
+):
+    """Stores hashes after a full import so the next delta import has a baseline."""
+    hashes = compute_hashes(
+        land_features, river_features, data_dir, files, intermediate
+    )
+    with psycopg2.connect(pg_url) as conn:
+        ensure_hash_table(conn)
+        store_hashes(conn, hashes)
+    conn.close()
+
+
+def diff_hashes(old, new):
+    """Returns (keys to upsert, keys to delete)."""
+    changed = {key for key, value in new.items() if old.get(key) != value}
+    return changed, set(old) - set(new)
+
+
+def changed_features(features, keys):
+    return (f for f in features if feature_key(f) in keys)
+
+
+def write_filtered_csv(source, keys, out_dir):
+    out_path = os.path.join(out_dir, os.path.basename(getattr(source, "name", source)))
+    with open_source(source) as src, open(
+        out_path, "w", newline="", encoding="utf-8"
+    ) as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst)
+        header = next(reader, None)
+        if header is not None:
+            writer.writerow(header)
+        writer.writerows(row for row in reader if row and row[0] in keys)
+    return out_path
+
+
+def delete_keys(cur, tables, keys, schema=SCHEMA):
+    for table in tables:
+        table = table.replace("spatial.", f"{schema}.")
+        cur.execute(f"DELETE FROM {table} WHERE id::text = ANY(%s)", (sorted(keys),))
+        logger.info(f"Deleted {cur.rowcount} rows from {table}")
+
+
+def replace_steps(plan, schema=SCHEMA):
+    """
+    run_import `prepare` functions that clear what a step re-adds, in that
+    step's own transaction: the old version of changed rows of appended
+    sources, and landmass when the land changed.
+    """
+    prepare = {}
+    for kind in APPEND_SOURCES:
+        changed = plan.get(kind, (set(), set()))[0]
+        if changed:
+            prepare[f"load:{kind}"] = partial(
+                delete_keys, tables=DELETE_FROM[kind], keys=changed, schema=schema
+            )
+    if plan.get("land", (set(), set()))[0]:
+        prepare["landmass"] = lambda cur: cur.execute(f"TRUNCATE {schema}.landmass")
+    return prepare
+
+
+def apply_deletes(conn, plan, schema=SCHEMA):
+    """Deletes the rows that are gone from the export; the caller commits."""
+    with conn.cursor() as cur:
+        for kind, tables in DELETE_FROM.items():
+            deleted = plan.get(kind, (set(), set()))[1]
+            if deleted:
+                delete_keys(cur, tables, deleted, schema)
+
+
+def import_delta(
+    pg_url,
+    land_features,
+    river_features,
+    data_dir=DATA_DIR,
+    workers=DB_WORKERS,
+    sql_file=ATTR_SQL,
+    files=None,
+    intermediate="geojson",
+):
+    """
+    Compares content hashes of the new export with those stored by the last
+    import and loads only new and changed features/rows through the usual
+    staging tables and ON CONFLICT upserts; rows that are gone are deleted
+    after the upserts succeeded, in the transaction that stores the hashes.
+    Without stored hashes every row counts as new. `files` is passed on to
+    run_import; `intermediate` is the format cells/routes were written in.
+    """
+    new = compute_hashes(land_features, river_features, data_dir, files, intermediate)
+    tmp_dir = tempfile.mkdtemp(prefix="delta-import-")
+    conn = psycopg2.connect(pg_url)
+    try:
+        ensure_hash_table(conn)
+        old = fetch_hashes(conn)
+        conn.commit()  # Do not sit in a transaction through the import
+        plan = {
+            kind: diff_hashes(old.get(kind, {}), rows) for kind, rows in new.items()
+        }
+        for kind, (changed, deleted) in plan.items():
+            logger.info(
+                f"Delta {kind}: {len(changed)} new/changed, {len(deleted)} removed"
+            )
+
+        sources = {"rivers": changed_features(river_features, plan["rivers"][0])}
+        for name in ("cells", "routes"):
+            if name in plan:
+                path = target_path(data_dir, LOAD_TARGETS[name], intermediate)
+                sources[name] = changed_features(iter_features(path), plan[name][0])
+        if plan["land"][0]:
+            sources["land"] = land_features
+        graph_file = os.path.join(data_dir, os.path.basename(CELL_GRAPH_FILE))
+        # Edges are cheap to rebuild, so any cell change reloads all of them
+        if any(plan.get("cells", ())) and os.path.exists(graph_file):
+            sources["cell_edges"] = load_csr(graph_file)
+        files = {
+            **(files or {}),
+            **{
+                os.path.join(DATA_DIR, name): write_filtered_csv(
+                    csv_source(name, data_dir, files), plan[name][0], tmp_dir
+                )
+                for name in CSV_FILES
+                if name in plan
+            },
+        }
+
+        results = run_import(
+            pg_url,
+            sources,
+            sql_file,
+            workers,
+            files=files,
+            append=APPEND_SOURCES,
+            prepare=replace_steps(plan),
+        )
+        # Only once every upsert succeeded: removed rows go and the hashes
+        # move on together, so a failed import is simply retried next time
+        apply_deletes(conn, plan)
+        store_hashes(conn, new)
+    finally:
+        conn.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
@@ -0,0 +1,124 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 10  # seconds, only used when inotify is not available
+# Seconds between the size/mtime checks of a new file. Inotify only reports
+# files that were closed or moved in, a scan can also see one mid-upload.
+STABLE_INTERVAL = 0.05
+POLL_STABLE_INTERVAL = 2
+STABLE_TIMEOUT = 600  # give up on a file that keeps changing for this long
+RESCAN_INTERVAL = 300  # inotify mode still rescans now and then to retry leftovers
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (followed by the name)
+
+
+class Inotify:
+    """Minimal ctypes binding to Linux inotify for one directory."""
+
+    def __init__(self, directory, mask=IN_CLOSE_WRITE | IN_MOVED_TO):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def read(self, timeout=None):
+        """Names of the files with events, waiting up to timeout seconds (None = forever)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        names, pos = [], 0
+        while pos < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            names.append(os.fsdecode(data[pos : pos + length].rstrip(b"\0")))
+            pos += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def wait_until_stable(path, interval=STABLE_INTERVAL, timeout=STABLE_TIMEOUT):
+    """
+    True once the size and mtime of path stay the same over `interval`, so a
+    file that is still being written is not picked up. False if it vanishes
+    or keeps changing past `timeout`.
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        before = os.stat(path)
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            after = os.stat(path)
+            if (
+                after.st_size == before.st_size
+                and after.st_mtime_ns == before.st_mtime_ns
+            ):
+                return True
+            before = after
+    except FileNotFoundError:
+        return False
+    logger.warning(f"{path} kept changing for {timeout}s, skipping it for now")
+    return False
+
+
+def _poll(directory, match, interval):
+    while True:
+        for name in sorted(os.listdir(directory)):
+            if match(name):
+                yield name
+        time.sleep(interval)
+
+
+def _inotify(directory, match, inotify):
+    try:
+        # Files that arrived before the watch was set up
+        names = os.listdir(directory)
+        while True:
+            for name in sorted(names):
+                if match(name):
+                    yield name
+            # A quiet interval means a rescan, e.g. for a file that failed before
+            names = inotify.read(RESCAN_INTERVAL) or os.listdir(directory)
+    finally:
+        inotify.close()
+
+
+def watch_files(directory, match, poll_interval=POLL_INTERVAL):
+    """
+    Yields the paths of files in `directory` whose name satisfies match(name)
+    once they are complete: right after a close-write or moved-to event with
+    inotify, or on the next scan every poll_interval seconds where inotify is
+    not available. The caller is expected to move a yielded file away.
+    """
+    try:
+        names = _inotify(directory, match, Inotify(directory))
+        stable_interval = STABLE_INTERVAL
+        logger.info(f"Watching {directory} with inotify")
+    except (OSError, AttributeError) as e:
+        logger.info(
+            f"inotify not available ({e}), scanning {directory} every {poll_interval}s"
+        )
+        names = _poll(directory, match, poll_interval)
+        stable_interval = POLL_STABLE_INTERVAL
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and wait_until_stable(path, stable_interval):
+            yield path
@@ -0,0 +1,180 @@
+import json
+import os
+import shutil
+import tempfile
+
+from geoparquet import GeoParquetFeatures, GeoParquetWriter, is_geoparquet
+
+CHUNK_SIZE = 1 << 20  # characters read per refill
+# Line-delimited GeoJSON (RFC 8142 GeoJSONSeq and newline-delimited variants)
+SEQ_EXTENSIONS = (".geojsons", ".geojsonl", ".geojsonseq", ".ndjson")
+RECORD_SEPARATOR = "\x1e"
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+def is_geojson_seq(path):
+    return path.lower().endswith(SEQ_EXTENSIONS)
+
+
+class _StreamReader:
+    """Minimal incremental JSON tokenizer over a text file."""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos] if self.pos < len(self.buf) else ""
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(
+                f"Malformed GeoJSON: expected '{char}', got '{self.peek() or 'EOF'}'"
+            )
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                # A scalar ending exactly at the buffer end may be truncated
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_features(source):
+    """
+    Iterates over the features of a GeoJSON FeatureCollection (or GeoJSONSeq
+    file) one at a time, reading the file incrementally so memory does not
+    grow with the number of features. `source` is a path or an open text
+    file, e.g. a zip member; a file is left open. GeoParquet paths are read
+    with geoparquet.GeoParquetFeatures.
+    """
+    if is_geoparquet(source):
+        return GeoParquetFeatures(source)
+    return _iter_source(source)
+
+
+def _iter_source(source):
+    if hasattr(source, "read"):
+        yield from _iter_stream(source, is_geojson_seq(getattr(source, "name", "")))
+        return
+    with open(source, "r", encoding="utf-8") as f:
+        yield from _iter_stream(f, is_geojson_seq(source))
+
+
+def _iter_stream(f, seq):
+    if seq:
+        for line in f:
+            line = line.strip(_WHITESPACE + RECORD_SEPARATOR)
+            if line:
+                yield json.loads(line)
+        return
+
+    reader = _StreamReader(f)
+    reader.expect("{")
+    while reader.peek() != "}":
+        key = reader.value()
+        reader.expect(":")
+        if key != "features":
+            reader.value()
+        else:
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield reader.value()
+                if reader.peek() == ",":
+                    reader.pos += 1
+            reader.expect("]")
+        if reader.peek() == ",":
+            reader.pos += 1
+
+
+class AtomicFeatureWriter:
+    """
+    Writes compact GeoJSON features to a temp file next to `path` and renames
+    it over `path` on a clean exit. Call discard() to keep the original file.
+    GeoJSONSeq paths are written one feature per line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.seq = is_geojson_seq(path)
+        self.count = 0
+        self._discarded = False
+
+    def __enter__(self):
+        fd, self._tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)),
+            prefix=f".{os.path.basename(self.path)}.",
+            suffix=".tmp",
+        )
+        self._f = os.fdopen(fd, "w", encoding="utf-8")
+        if not self.seq:
+            self._f.write('{"type":"FeatureCollection","features":[')
+        return self
+
+    def write(self, feature):
+        if self.seq:
+            self._f.write(json.dumps(feature, separators=(",", ":")))
+            self._f.write("\n")
+        else:
+            if self.count:
+                self._f.write(",")
+            self._f.write(json.dumps(feature, separators=(",", ":")))
+        self.count += 1
+
+    def write_many(self, features):
+        for feature in features:
+            self.write(feature)
+
+    def discard(self):
+        self._discarded = True
+
+    def __exit__(self, exc_type, exc, tb):
+        commit = exc_type is None and not self._discarded
+        try:
+            if commit and not self.seq:
+                self._f.write("]}")
+            self._f.close()
+            if commit:
+                # mkstemp creates 0600 files; keep the permissions of the file we replace
+                if os.path.exists(self.path):
+                    shutil.copymode(self.path, self._tmp_path)
+                else:
+                    os.chmod(self._tmp_path, 0o644)
+                os.replace(self._tmp_path, self.path)
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.unlink(self._tmp_path)
+        return False
+
+
+def feature_writer(path):
+    """GeoParquetWriter for .parquet paths, else AtomicFeatureWriter."""
+    if is_geoparquet(path):
+        return GeoParquetWriter(path)
+    return AtomicFeatureWriter(path)
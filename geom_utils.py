@@ -1,5 +1,32 @@
 import re
-from svgpathtools import parse_path
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import chain, repeat
+from operator import itemgetter, setitem
+import numpy as np
+import shapely
+from svgpathtools import Arc, Line, parse_path
+
+# Commands FMG emits in path data; anything else (S/T/A) falls back to svgpathtools.
+# "|" separates paths when a batch is tokenized together.
+_PATH_COMMAND_RE = re.compile(r"([MmLlHhVvCcQqZz|])")
+_PATH_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_UNSUPPORTED_COMMAND_RE = re.compile(r"[SsTtAa|]")
+_COMMA_TO_SPACE = str.maketrans(",", " ")
+_PATH_SEPARATOR = ord("|")
+_COMMAND_ARITY = np.zeros(128, dtype=np.int64)
+for _cmd, _arity in {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "Q": 4, "Z": 0}.items():
+    _COMMAND_ARITY[ord(_cmd)] = _arity
+
+# Nesting depth of the "coordinates" member down to a single position
+GEOMETRY_DEPTH = {
+    "Point": 1,
+    "MultiPoint": 2,
+    "LineString": 2,
+    "MultiLineString": 3,
+    "Polygon": 3,
+    "MultiPolygon": 4,
+}
 
 
 def flip_y_recursive(coords, SVG_HEIGHT):
@@ -15,44 +42,483 @@ def flip_y_recursive(coords, SVG_HEIGHT):
     return coords
 
 
-def svg_path_to_coords(d_str):
+def _segment_sample_count(seg, tolerance):
+    """Number of uniform chords keeping an svgpathtools curve within `tolerance`."""
+    if isinstance(seg, Arc):
+        rx, ry = abs(seg.radius.real), abs(seg.radius.imag)
+        # Smallest radius of curvature of the ellipse; sagitta of a chord c is c^2 / 8r
+        r = min(rx, ry) ** 2 / max(rx, ry) if max(rx, ry) else 0.0
+        n = np.ceil(seg.length() / np.sqrt(8 * r * tolerance)) if r else 1
+    else:
+        p = seg.bpoints()
+        if len(p) == 3:
+            n = np.ceil(np.sqrt(abs(p[0] - 2 * p[1] + p[2]) / (4 * tolerance)))
+        else:
+            d = max(abs(p[0] - 2 * p[1] + p[2]), abs(p[1] - 2 * p[2] + p[3]))
+            n = np.ceil(np.sqrt(0.75 * d / tolerance))
+    return int(min(max(n, 1), 1024))
+
+
+def _svg_path_to_coords_svgpathtools(d_str, tolerance=None):
+    """Reference implementation, used for path data the tokenizer does not handle."""
     path = parse_path(d_str)
     coords = []
     for seg in path:
         if hasattr(seg, "start"):
             coords.append((seg.start.real, seg.start.imag))
+        if tolerance and not isinstance(seg, Line):
+            n = _segment_sample_count(seg, tolerance)
+            for t in np.linspace(0, 1, n + 1)[1:-1]:
+                pt = seg.point(t)
+                coords.append((pt.real, pt.imag))
         if hasattr(seg, "end"):
             coords.append((seg.end.real, seg.end.imag))
-    return coords
+    return deduplicate(coords)
+
+
+def _accumulate(values, is_abs, base):
+    """
+    Resolves one axis of a run of path commands to absolute positions: absolute
+    commands set the value, relative ones add to the running position.
+    """
+    if is_abs.all():
+        return values
+    if not is_abs.any():
+        return np.cumsum(np.concatenate(([base], values)))[1:]
+    if not values[~is_abs].any():
+        # Only absolute values plus zero deltas (H/V on the other axis): forward fill
+        last = np.maximum.accumulate(np.where(is_abs, np.arange(len(values)), -1))
+        return np.where(last >= 0, values[np.maximum(last, 0)], base)
+    out = np.empty_like(values)
+    edges = np.unique(np.concatenate(([0], np.flatnonzero(is_abs), [len(values)])))
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if is_abs[lo]:
+            out[lo:hi] = np.cumsum(values[lo:hi])
+        else:
+            out[lo:hi] = np.cumsum(np.concatenate(([base], values[lo:hi])))[1:]
+        base = out[hi - 1]
+    return out
+
+
+def _tokenize_paths(d_strings):
+    """
+    Tokenizes a batch of path data strings in one pass and expands it to one
+    row per drawing instruction (implicit repeats included, extra M pairs
+    become L). Paths that are malformed are marked invalid and left out.
+    """
+    parts = _PATH_COMMAND_RE.split(
+        ("|" + "|".join(d_strings)).translate(_COMMA_TO_SPACE)
+    )
+    args = parts[2::2]
+    # Count the whitespace-separated numbers of every command on the raw bytes
+    arg_bytes = np.frombuffer("\0".join(args).encode("utf-8"), dtype=np.uint8)
+    is_blank = arg_bytes <= 32
+    token_start = ~is_blank
+    token_start[1:] &= is_blank[:-1]
+    cmd_of_byte = np.cumsum(arg_bytes == 0)
+    n_args = np.bincount(cmd_of_byte[token_start], minlength=len(args))
+    try:
+        nums = np.fromstring(" ".join(args), sep=" ")
+    except ValueError:
+        nums = None
+    if nums is None or nums.size != n_args.sum():
+        # Numbers written without separators, e.g. "1-2" or ".5.5"
+        arg_tokens = [_PATH_NUMBER_RE.findall(a) for a in args]
+        n_args = np.array([len(a) for a in arg_tokens], dtype=np.int64)
+        nums = np.array([n for a in arg_tokens for n in a], dtype=np.float64)
+    letters = np.frombuffer("".join(parts[1::2]).encode("ascii"), dtype=np.uint8)
+    is_separator = letters == _PATH_SEPARATOR
+    path_of_cmd = np.cumsum(is_separator) - 1
+    upper = letters & 0xDF
+    arity = _COMMAND_ARITY[upper]
+    is_close = upper == ord("Z")
+    bad_cmd = np.where(
+        is_close | is_separator,
+        n_args > 0,
+        (n_args == 0) | (n_args % np.maximum(arity, 1) != 0),
+    )
+    # Every path must start with M/m right after its separator
+    first_cmd = np.flatnonzero(is_separator) + 1
+    starts_with_move = np.zeros(len(d_strings), dtype=bool)
+    has_cmd = first_cmd < letters.size
+    starts_with_move[has_cmd] = upper[first_cmd[has_cmd]] == ord("M")
+    valid_path = starts_with_move & (
+        np.bincount(path_of_cmd[bad_cmd], minlength=len(d_strings)) == 0
+    )
+    keep = ~is_separator & valid_path[path_of_cmd]
+    nums = nums[np.repeat(keep, n_args)]
+    letters, upper, arity, n_args = (
+        letters[keep],
+        upper[keep],
+        arity[keep],
+        n_args[keep],
+    )
+    path_of_cmd, is_close = path_of_cmd[keep], is_close[keep]
+
+    n_inst = np.where(is_close, 1, n_args // np.maximum(arity, 1))
+    # Exclusive prefix sums; also empty when every path was malformed
+    first_inst = np.cumsum(n_inst) - n_inst
+    first_num = np.cumsum(n_args) - n_args
+    code = np.repeat(upper, n_inst)
+    repeat_idx = np.arange(code.size) - np.repeat(first_inst, n_inst)
+    inst_arity = np.repeat(arity, n_inst)
+    path_of_inst = np.repeat(path_of_cmd, n_inst)
+    is_move = (code == ord("M")) & (repeat_idx == 0)
+    code[(code == ord("M")) & (repeat_idx > 0)] = ord("L")
+    rel = np.repeat(letters != upper, n_inst)
+    # A leading relative m is relative to the origin, i.e. absolute
+    path_first = np.ones(code.size, dtype=bool)
+    path_first[1:] = path_of_inst[1:] != path_of_inst[:-1]
+    rel[path_first] = False
+    return {
+        "code": code,
+        "rel": rel,
+        "arity": inst_arity,
+        "offset": np.repeat(first_num, n_inst) + repeat_idx * inst_arity,
+        "nums": nums,
+        "is_move": is_move,
+        "path": path_of_inst,
+        "valid": valid_path,
+    }
+
+
+def _resolve_endpoints(inst):
+    """
+    Returns the absolute (n, 2) end point of every instruction; Z resolves to
+    its subpath start. Absolute-only paths (what FMG writes) are resolved fully
+    vectorized; relative commands are accumulated run by run between M/Z.
+    """
+    code, rel, nums, offset = inst["code"], inst["rel"], inst["nums"], inst["offset"]
+    is_move = inst["is_move"]
+    is_h = code == ord("H")
+    is_v = code == ord("V")
+    is_close = code == ord("Z")
+    is_2d = ~(is_h | is_v | is_close)
+    end_x = np.zeros(code.size)
+    end_y = np.zeros(code.size)
+    end_idx = offset[is_2d] + inst["arity"][is_2d] - 2
+    end_x[is_2d] = nums[end_idx]
+    end_y[is_2d] = nums[end_idx + 1]
+    end_x[is_h] = nums[offset[is_h]]
+    end_y[is_v] = nums[offset[is_v]]
+    x_abs = ~rel & (is_2d | is_h)
+    y_abs = ~rel & (is_2d | is_v)
+
+    if not rel.any():
+        last_move = np.maximum.accumulate(np.where(is_move, np.arange(code.size), 0))
+        end_x[is_close] = end_x[last_move[is_close]]
+        end_y[is_close] = end_y[last_move[is_close]]
+        return np.column_stack(
+            (
+                _accumulate(end_x, x_abs | is_close, 0.0),
+                _accumulate(end_y, y_abs | is_close, 0.0),
+            )
+        )
+
+    ends = np.empty((code.size, 2))
+    breaks = np.flatnonzero(is_move | is_close)
+    bounds = np.append(breaks, code.size)
+    current = np.zeros(2)
+    subpath_start = current
+    for k, b in enumerate(breaks):
+        if is_close[b]:
+            current = subpath_start
+        else:
+            delta = np.array([end_x[b], end_y[b]])
+            current = current + delta if rel[b] else delta
+            subpath_start = current
+        ends[b] = current
+        lo, hi = b + 1, bounds[k + 1]
+        if hi > lo:
+            ends[lo:hi, 0] = _accumulate(end_x[lo:hi], x_abs[lo:hi], current[0])
+            ends[lo:hi, 1] = _accumulate(end_y[lo:hi], y_abs[lo:hi], current[1])
+            current = ends[hi - 1].copy()
+    return ends
+
+
+def _path_segments(inst):
+    """
+    Returns (starts, ends, mask) where mask selects the instructions that draw
+    a segment: everything but M, and Z only when it is not already closed.
+    """
+    ends = _resolve_endpoints(inst)
+    starts = np.empty_like(ends)
+    starts[0] = 0.0
+    starts[1:] = ends[:-1]
+    is_close = inst["code"] == ord("Z")
+    degenerate_close = is_close & np.all(starts == ends, axis=1)
+    return starts, ends, ~inst["is_move"] & ~degenerate_close
+
+
+def _densify_segments(inst, starts, ends, is_segment, tolerance):
+    """
+    Samples every segment at uniform parameter steps so the chord error of
+    curved segments stays within `tolerance`. Returns (points, segment index of
+    each point); each segment contributes its start point plus n samples.
+
+    For a Bezier curve with maximum second derivative D, n uniform chords
+    deviate by at most D / (8 n^2), which gives n per segment in closed form.
+    """
+    idx = np.flatnonzero(is_segment)
+    code = inst["code"][idx]
+    offset = inst["offset"][idx]
+    rel = inst["rel"][idx]
+    nums = inst["nums"]
+    p0 = starts[idx]
+    p3 = ends[idx]
+    is_cubic = code == ord("C")
+    is_quad = code == ord("Q")
+    is_curve = is_cubic | is_quad
+    c1 = p0.copy()
+    c2 = p3.copy()
+    off = offset[is_curve]
+    c1[is_curve] = np.column_stack((nums[off], nums[off + 1]))
+    off = offset[is_cubic]
+    c2[is_cubic] = np.column_stack((nums[off + 2], nums[off + 3]))
+    c1[is_curve & rel] += p0[is_curve & rel]
+    c2[is_cubic & rel] += p0[is_cubic & rel]
+    # Quadratic curves as cubics: shared evaluation below
+    c1[is_quad], c2[is_quad] = (
+        p0[is_quad] + 2.0 / 3.0 * (c1[is_quad] - p0[is_quad]),
+        p3[is_quad] + 2.0 / 3.0 * (c1[is_quad] - p3[is_quad]),
+    )
+
+    second_diff = np.maximum(
+        np.hypot(*(p0 - 2 * c1 + c2).T), np.hypot(*(c1 - 2 * c2 + p3).T)
+    )
+    n = np.ones(idx.size, dtype=np.int64)
+    n[is_curve] = np.ceil(np.sqrt(0.75 * second_diff[is_curve] / tolerance))
+    n = np.clip(n, 1, 1024)
+
+    rows = n + 1
+    seg_of_row = np.repeat(np.arange(idx.size), rows)
+    step = np.arange(seg_of_row.size) - np.repeat(np.cumsum(rows) - rows, rows)
+    t = (step / n[seg_of_row])[:, None]
+    mt = 1.0 - t
+    points = (
+        mt**3 * p0[seg_of_row]
+        + 3 * mt**2 * t * c1[seg_of_row]
+        + 3 * mt * t**2 * c2[seg_of_row]
+        + t**3 * p3[seg_of_row]
+    )
+    # Keep the exact endpoints rather than their evaluated approximations
+    points[step == 0] = p0
+    points[step == n[seg_of_row]] = p3
+    return points, idx[seg_of_row]
+
+
+def svg_paths_to_coords(d_strings, tolerance=None):
+    """
+    Flattens a batch of SVG path data strings to a list of (N, 2) float64
+    arrays with consecutive duplicates removed. The whole batch is tokenized
+    and resolved with array operations at once.
+
+    By default only segment endpoints are kept, matching svgpathtools' segment
+    start/end points. With `tolerance` (in pixels), C/Q curves are densified so
+    no chord deviates from the curve by more than `tolerance`.
+    """
+    results = [None] * len(d_strings)
+    batch = [
+        i for i, d in enumerate(d_strings) if not _UNSUPPORTED_COMMAND_RE.search(d)
+    ]
+    if batch:
+        inst = _tokenize_paths([d_strings[i] for i in batch])
+        if inst["code"].size:
+            starts, ends, is_segment = _path_segments(inst)
+            if tolerance:
+                coords, inst_of_row = _densify_segments(
+                    inst, starts, ends, is_segment, tolerance
+                )
+                path_of_row = inst["path"][inst_of_row]
+            else:
+                coords = np.empty((2 * np.count_nonzero(is_segment), 2))
+                coords[0::2] = starts[is_segment]
+                coords[1::2] = ends[is_segment]
+                path_of_row = np.repeat(inst["path"][is_segment], 2)
+            keep = np.ones(len(coords), dtype=bool)
+            keep[1:] = np.any(coords[1:] != coords[:-1], axis=1) | (
+                path_of_row[1:] != path_of_row[:-1]
+            )
+            counts = np.bincount(path_of_row[keep], minlength=len(batch))
+            per_path = np.split(coords[keep], np.cumsum(counts)[:-1])
+        else:
+            per_path = [np.empty((0, 2))] * len(batch)
+        for i, valid, coords in zip(batch, inst["valid"], per_path):
+            if valid:
+                results[i] = coords
+    for i, coords in enumerate(results):
+        if coords is None:
+            results[i] = _svg_path_to_coords_svgpathtools(d_strings[i], tolerance)
+    return results
+
+
+def svg_path_to_coords(d_str, tolerance=None):
+    return svg_paths_to_coords([d_str], tolerance)[0]
+
+
+def intersecting_groups(geoms, cutters):
+    """
+    For each geometry, the indices of the cutters whose bounding boxes
+    intersect it, found with one STRtree query.
+    """
+    groups = [np.empty(0, dtype=np.intp) for _ in range(len(geoms))]
+    if len(geoms) == 0 or len(cutters) == 0:
+        return groups
+    geom_idx, cutter_idx = shapely.STRtree(cutters).query(geoms)
+    order = np.argsort(geom_idx, kind="stable")
+    geom_idx, cutter_idx = geom_idx[order], cutter_idx[order]
+    hit, first = np.unique(geom_idx, return_index=True)
+    for i, group in zip(hit, np.split(cutter_idx, first[1:])):
+        groups[i] = group
+    return groups
+
+
+def subtract_groups(geoms, cutter_groups):
+    """
+    Removes from each geometry the union of its own group of cutters; all
+    differences run as one vectorized shapely.difference call.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    hit = np.array([len(g) > 0 for g in cutter_groups], dtype=bool)
+    if not hit.any():
+        return geoms
+    masks = np.empty(np.count_nonzero(hit), dtype=object)
+    for i, group in enumerate(g for g in cutter_groups if len(g)):
+        masks[i] = group[0] if len(group) == 1 else shapely.union_all(group)
+    result = geoms.copy()
+    result[hit] = shapely.difference(geoms[hit], masks)
+    return result
+
+
+def split_chunks(items, n_chunks):
+    """Splits a sequence into at most n_chunks contiguous slices of similar size."""
+    size = max(1, -(-len(items) // max(n_chunks, 1)))
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def map_chunks(func, chunks, workers=1):
+    """
+    Calls func(*args) for every argument tuple in chunks, across a
+    ProcessPoolExecutor when workers > 1. Results keep the input order.
+    """
+    if workers <= 1 or len(chunks) <= 1:
+        return [func(*args) for args in chunks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        return list(executor.map(func, *zip(*chunks)))
+
+
+def simplify_geometries(geoms, tolerance):
+    """
+    Douglas-Peucker simplification of a sequence of shapely geometries as one
+    array operation. Topology is preserved, so polygons stay valid.
+    """
+    return shapely.simplify(
+        np.asarray(geoms, dtype=object), tolerance, preserve_topology=True
+    )
 
 
 def deduplicate(coords):
-    if not coords:
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(coords) < 2:
         return coords
-    deduped = [coords[0]]
-    for pt in coords[1:]:
-        if pt != deduped[-1]:
-            deduped.append(pt)
-    return deduped
+    keep = np.empty(len(coords), dtype=bool)
+    keep[0] = True
+    np.any(coords[1:] != coords[:-1], axis=1, out=keep[1:])
+    return coords[keep]
 
 
 def ensure_closed(coords):
-    if coords and coords[0] != coords[-1]:
-        coords.append(coords[0])
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(coords) and np.any(coords[0] != coords[-1]):
+        coords = np.vstack((coords, coords[:1]))
+    return coords
+
+
+def affine_transform(coords, scale=(1.0, 1.0), offset=(0.0, 0.0)):
+    """
+    Applies x' = sx * x + ox, y' = sy * y + oy to an (N, 2+) coordinate array in
+    one vectorized operation. Extra dimensions (e.g. Z) are left untouched.
+    """
+    coords = np.array(coords, dtype=np.float64)
+    if coords.ndim == 1:
+        coords = coords.reshape(-1, 2)
+    coords[:, :2] *= scale
+    coords[:, :2] += offset
+    return coords
+
+
+def _collect_positions(coords, depth, positions):
+    if depth == 1:
+        positions.append(coords)
+    elif depth == 2:
+        positions.extend(coords)
+    elif depth == 3:
+        positions.extend(chain.from_iterable(coords))
+    else:
+        for part in coords:
+            _collect_positions(part, depth - 1, positions)
+
+
+def _exact_number(value):
+    """value as an int when it is integral, so int coordinates stay ints."""
+    return int(value) if float(value).is_integer() else value
+
+
+def transform_features(features, scale=(1.0, 1.0), offset=(0.0, 0.0)):
+    """
+    Affine-transforms the coordinates of many GeoJSON features in place. The
+    positions are gathered once and each axis the transform changes is
+    computed as one object array and written back into the existing [x, y]
+    lists, so no per-point lists are allocated. The arithmetic is Python's,
+    so int coordinates stay ints under an integral transform like the Y flip
+    (1329 -> 671, not 671.0). Unknown geometry types and tuple coordinates
+    (e.g. from shapely's mapping) fall back to a recursive walk.
+    """
+    scale = [_exact_number(v) for v in scale]
+    offset = [_exact_number(v) for v in offset]
+    positions = []
+    for feature in features:
+        geom = feature.get("geometry")
+        if not geom or "coordinates" not in geom:
+            continue
+        depth = GEOMETRY_DEPTH.get(geom.get("type"))
+        if depth is None or not isinstance(geom["coordinates"], list):
+            geom["coordinates"] = _transform_recursive(
+                geom["coordinates"], scale, offset
+            )
+            continue
+        _collect_positions(geom["coordinates"], depth, positions)
+
+    for axis in (0, 1):
+        if scale[axis] == 1 and offset[axis] == 0:
+            continue  # Only touch the axes the transform actually changes
+        values = np.fromiter(
+            map(itemgetter(axis), positions), dtype=object, count=len(positions)
+        )
+        values = values * scale[axis] + offset[axis]
+        # Write back without a Python-level loop; Z values are left alone
+        deque(map(setitem, positions, repeat(axis), values.tolist()), maxlen=0)
+
+
+def _transform_recursive(coords, scale, offset):
+    if isinstance(coords, (list, tuple)):
+        if coords and all(isinstance(val, (int, float)) for val in coords):
+            x, y, *rest = coords
+            return [x * scale[0] + offset[0], y * scale[1] + offset[1], *rest]
+        return [_transform_recursive(c, scale, offset) for c in coords]
     return coords
 
 
 def flip_y(coords, SVG_HEIGHT=1000):
-    return [(x, SVG_HEIGHT - y) for x, y in coords]
+    return affine_transform(coords, (1.0, -1.0), (0.0, SVG_HEIGHT))
 
 
-def flip_y_coords_in_feature(feature, SVG_HEIGHT=1000):
-    geom = feature.get("geometry")
-    if not geom or "coordinates" not in geom:
-        return
+def flip_y_coords_in_features(features, SVG_HEIGHT=1000):
+    transform_features(features, (1.0, -1.0), (0.0, SVG_HEIGHT))
 
-    coords = geom["coordinates"]
-    geom["coordinates"] = flip_y_recursive(coords, SVG_HEIGHT)
+
+def flip_y_coords_in_feature(feature, SVG_HEIGHT=1000):
+    flip_y_coords_in_features([feature], SVG_HEIGHT)
 
 
 def strip_river_prefix_and_make_int(feature_id):
@@ -0,0 +1,381 @@
+import json
+import os
+import shutil
+import tempfile
+from itertools import chain
+
+import numpy as np
+import shapely
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only needed for --intermediate geoparquet
+    pa = pq = None
+
+PARQUET_EXTENSION = ".parquet"
+PARQUET_EXTENSIONS = (PARQUET_EXTENSION, ".geoparquet")
+BATCH_SIZE = 65536  # Features per record batch / row group
+COMPRESSION = "zstd"
+GEOMETRY_COLUMN = "geometry"
+# GeoParquet 1.1 bbox covering, so readers can skip row groups by extent
+BBOX_COLUMN = "bbox"
+# The top-level "id" of a feature, when it has one next to its properties
+FEATURE_ID_COLUMN = "__feature_id"
+RESERVED_COLUMNS = (GEOMETRY_COLUMN, BBOX_COLUMN, FEATURE_ID_COLUMN)
+# Properties without one Arrow type are stored as JSON text, listed here
+JSON_COLUMNS_KEY = b"json_columns"
+BBOX_FIELDS = ["xmin", "ymin", "xmax", "ymax"]
+GEO_METADATA_VERSION = "1.1.0"
+# Levels of nested lists above the coordinate pairs, per GeoJSON type
+_NESTING = {
+    "Point": 0,
+    "LineString": 1,
+    "MultiPoint": 1,
+    "Polygon": 2,
+    "MultiLineString": 2,
+    "MultiPolygon": 3,
+}
+_TYPE_NAMES = {
+    int(shapely.GeometryType[name.upper()]): name
+    for name in (*_NESTING, "GeometryCollection")
+}
+
+
+def is_geoparquet(path):
+    return isinstance(path, str) and path.lower().endswith(PARQUET_EXTENSIONS)
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("GeoParquet needs pyarrow: pip install pyarrow")
+
+
+def _from_coordinates(geom_type, coordinates):
+    """Geometries of one GeoJSON type from their coordinate lists, in one GEOS call."""
+    offsets = []
+    parts = coordinates
+    for _ in range(_NESTING[geom_type]):
+        offsets.append(np.cumsum([0] + [len(p) for p in parts]))
+        parts = list(chain.from_iterable(parts))
+    coords = np.array(parts, dtype=np.float64).reshape(len(parts), -1)
+    return shapely.from_ragged_array(
+        shapely.GeometryType[geom_type.upper()], coords, tuple(reversed(offsets))
+    )
+
+
+def geometries_from_geojson(geometries):
+    """
+    Shapely array of GeoJSON geometry dicts (None stays None). Each type is
+    built from flat coordinate arrays, much faster than shape() per feature;
+    anything else goes through GEOS' GeoJSON reader.
+    """
+    out = np.full(len(geometries), None, dtype=object)
+    by_type = {}
+    for i, geom in enumerate(geometries):
+        if geom:
+            by_type.setdefault(geom.get("type"), []).append(i)
+    for geom_type, idx in by_type.items():
+        idx = np.array(idx)
+        try:
+            out[idx] = _from_coordinates(
+                geom_type, [geometries[i]["coordinates"] for i in idx]
+            )
+        except (KeyError, ValueError, TypeError):
+            # GeometryCollection, mixed dimensions, empty parts, ...
+            out[idx] = shapely.from_geojson([json.dumps(geometries[i]) for i in idx])
+    return out
+
+
+def _to_array(values):
+    """Arrow array of a property's values, or None if they have no single type."""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return None
+
+
+def _merge_types(a, b):
+    """
+    The type that holds values of both (int64 + double -> double, null + x
+    -> x, ...), or None if there is none. Never a lossy conversion such as
+    a float truncated to an integer.
+    """
+    try:
+        schema = pa.unify_schemas(
+            [pa.schema([("v", a)]), pa.schema([("v", b)])],
+            promote_options="permissive",
+        )
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+    return schema.field("v").type
+
+
+def _json_array(values):
+    return pa.array([None if v is None else json.dumps(v) for v in values], pa.string())
+
+
+class GeoParquetWriter:
+    """
+    Writes features as GeoParquet: WKB geometries, a bbox covering and one
+    typed column per property, in compressed row groups of BATCH_SIZE.
+    Same interface as geojson_utils.AtomicFeatureWriter: the file appears at
+    `path` on a clean exit, discard() keeps the original.
+
+    The schema comes from the first batch. A later property with a type that
+    does not fit (e.g. a float in an integer column) or a new property widens
+    it and rewrites what was written so far. Features missing a property
+    read back with it set to null.
+    """
+
+    def __init__(self, path):
+        require_pyarrow()
+        self.path = path
+        self.count = 0
+        self._discarded = False
+        self._batch = []
+        self._schema = None
+        self._json_columns = set()
+        self._writer = None
+        self._geometry_types = set()
+        self._bounds = [np.inf, np.inf, -np.inf, -np.inf]
+
+    def __enter__(self):
+        fd, self._tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)),
+            prefix=f".{os.path.basename(self.path)}.",
+            suffix=".tmp",
+        )
+        os.close(fd)
+        return self
+
+    def write(self, feature):
+        self._batch.append(feature)
+        self.count += 1
+        if len(self._batch) == BATCH_SIZE:
+            self._flush()
+
+    def write_many(self, features):
+        for feature in features:
+            self.write(feature)
+
+    def discard(self):
+        self._discarded = True
+
+    def _rows(self, features):
+        rows = []
+        for feat in features:
+            props = feat.get("properties") or {}
+            for name in RESERVED_COLUMNS:
+                if name in props:
+                    raise ValueError(
+                        f"Property '{name}' is reserved in GeoParquet output"
+                    )
+            if feat.get("id") is not None:
+                props = {**props, FEATURE_ID_COLUMN: feat["id"]}
+            rows.append(props)
+        return rows
+
+    def _flush(self):
+        if not self._batch:
+            return
+        features, self._batch = self._batch, []
+        rows = self._rows(features)
+        names = list(dict.fromkeys(chain.from_iterable(rows)))
+        columns = self._fit_schema(
+            {name: [row.get(name) for row in rows] for name in names}, len(rows)
+        )
+
+        geoms = geometries_from_geojson([feat.get("geometry") for feat in features])
+        self._geometry_types.update(
+            shapely.get_type_id(geoms[~shapely.is_missing(geoms)]).tolist()
+        )
+        bounds = shapely.bounds(geoms)
+        if np.isfinite(bounds).any():
+            self._bounds = [
+                *np.fmin(self._bounds[:2], np.nanmin(bounds[:, :2], axis=0)),
+                *np.fmax(self._bounds[2:], np.nanmax(bounds[:, 2:], axis=0)),
+            ]
+        arrays = [
+            pa.array(shapely.to_wkb(geoms), type=pa.binary()),
+            pa.StructArray.from_arrays(
+                [pa.array(bounds[:, i], from_pandas=True) for i in range(4)],
+                names=BBOX_FIELDS,
+            ),
+            *columns,
+        ]
+        self._writer.write_batch(
+            pa.RecordBatch.from_arrays(arrays, schema=self._schema)
+        )
+
+    def _fit_schema(self, columns, n_rows):
+        """
+        Arrow arrays of the batch's properties in schema order. The first
+        batch creates the schema; a later one that does not fit widens it.
+        """
+        fields = {field.name: field for field in list(self._schema or [])[2:]}
+        json_columns = set(self._json_columns)
+        arrays = {}
+        for name, values in columns.items():
+            array = None if name in json_columns else _to_array(values)
+            if array is not None:
+                field = fields.get(name)
+                value_type = (
+                    array.type
+                    if field is None
+                    else _merge_types(field.type, array.type)
+                )
+                if value_type is None:
+                    array = None
+                elif field is None or field.type != value_type:
+                    fields[name] = pa.field(name, value_type)
+            if array is None:
+                json_columns.add(name)
+                fields[name] = pa.field(name, pa.string())
+                arrays[name] = _json_array(values)
+            else:
+                arrays[name] = array.cast(fields[name].type)
+
+        if (
+            self._schema is None
+            or len(fields) + 2 != len(self._schema)
+            or any(fields[f.name] != f for f in list(self._schema)[2:])
+        ):
+            schema = pa.schema(
+                [
+                    pa.field(GEOMETRY_COLUMN, pa.binary()),
+                    pa.field(
+                        BBOX_COLUMN, pa.struct([(c, pa.float64()) for c in BBOX_FIELDS])
+                    ),
+                    *fields.values(),
+                ],
+                metadata={JSON_COLUMNS_KEY: json.dumps(sorted(json_columns))},
+            )
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(
+                    self._tmp_path, schema, compression=COMPRESSION
+                )
+            else:
+                self._rewrite(schema, json_columns - self._json_columns)
+            self._schema, self._json_columns = schema, json_columns
+        return [
+            arrays[name] if name in arrays else pa.nulls(n_rows, type=field.type)
+            for name, field in fields.items()
+        ]
+
+    def _rewrite(self, schema, to_json):
+        """
+        Reopens the file with the wider schema, converting the rows written so
+        far one row group at a time, so a widening never holds the whole file
+        in memory.
+        """
+        self._writer.close()
+        old_path = self._tmp_path + ".old"
+        os.replace(self._tmp_path, old_path)
+        try:
+            self._writer = pq.ParquetWriter(
+                self._tmp_path, schema, compression=COMPRESSION
+            )
+            with pq.ParquetFile(old_path) as old:
+                for i in range(old.num_row_groups):
+                    group = old.read_row_group(i)
+                    arrays = []
+                    for field in schema:
+                        if field.name not in group.column_names:
+                            arrays.append(pa.nulls(len(group), type=field.type))
+                        elif field.name in to_json:
+                            arrays.append(
+                                _json_array(group.column(field.name).to_pylist())
+                            )
+                        else:
+                            arrays.append(group.column(field.name).cast(field.type))
+                    self._writer.write_table(
+                        pa.Table.from_arrays(arrays, schema=schema),
+                        row_group_size=BATCH_SIZE,
+                    )
+        finally:
+            os.unlink(old_path)
+
+    def _geo_metadata(self):
+        column = {
+            "encoding": "WKB",
+            "geometry_types": sorted(_TYPE_NAMES[t] for t in self._geometry_types),
+            "covering": {"bbox": {key: [BBOX_COLUMN, key] for key in BBOX_FIELDS}},
+        }
+        if np.isfinite(self._bounds).all():
+            column["bbox"] = [float(b) for b in self._bounds]
+        return {
+            "version": GEO_METADATA_VERSION,
+            "primary_column": GEOMETRY_COLUMN,
+            "columns": {GEOMETRY_COLUMN: column},
+        }
+
+    def __exit__(self, exc_type, exc, tb):
+        commit = exc_type is None and not self._discarded
+        try:
+            if commit:
+                self._flush()
+                if self._writer is None:
+                    self._fit_schema({}, 0)
+                self._writer.add_key_value_metadata(
+                    {"geo": json.dumps(self._geo_metadata())}
+                )
+            if self._writer is not None:
+                self._writer.close()
+            if commit:
+                # mkstemp creates 0600 files; keep the permissions of the file we replace
+                if os.path.exists(self.path):
+                    shutil.copymode(self.path, self._tmp_path)
+                else:
+                    os.chmod(self._tmp_path, 0o644)
+                os.replace(self._tmp_path, self.path)
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.unlink(self._tmp_path)
+        return False
+
+
+class GeoParquetFeatures:
+    """
+    The features of a GeoParquet file written by GeoParquetWriter. Iterating
+    yields GeoJSON feature dicts like geojson_utils.iter_features; batches()
+    yields (shapely geometries, properties, ids) for readers that can use
+    the geometries without a GeoJSON round trip, such as pg_loader.
+    """
+
+    def __init__(self, path):
+        require_pyarrow()
+        self.path = path
+
+    def batches(self):
+        f = pq.ParquetFile(self.path)
+        metadata = f.schema_arrow.metadata or {}
+        json_columns = set(json.loads(metadata.get(JSON_COLUMNS_KEY, b"[]")))
+        names = [
+            n for n in f.schema_arrow.names if n not in (GEOMETRY_COLUMN, BBOX_COLUMN)
+        ]
+        for batch in f.iter_batches(batch_size=BATCH_SIZE):
+            wkbs = batch.column(GEOMETRY_COLUMN).to_numpy(zero_copy_only=False)
+            geoms = shapely.from_wkb(wkbs)
+            rows = batch.select(names).to_pylist()
+            ids = []
+            for row in rows:
+                ids.append(row.pop(FEATURE_ID_COLUMN, None))
+                for name in json_columns & row.keys():
+                    if row[name] is not None:
+                        row[name] = json.loads(row[name])
+            yield geoms, rows, ids
+
+    def __iter__(self):
+        for geoms, rows, ids in self.batches():
+            for geojson_text, props, feature_id in zip(
+                shapely.to_geojson(geoms), rows, ids
+            ):
+                feature = {"type": "Feature"}
+                if feature_id is not None:
+                    feature["id"] = feature_id
+                feature["geometry"] = (
+                    None if geojson_text is None else json.loads(geojson_text)
+                )
+                feature["properties"] = props
+                yield feature
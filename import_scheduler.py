@@ -0,0 +1,279 @@
+import argparse
+import logging
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+
+from cell_graph import CELL_GRAPH_FILE, copy_edges, load_csr
+from geojson_utils import iter_features
+from pg_loader import (
+    DATA_DIR,
+    INTERMEDIATE_FORMAT,
+    INTERMEDIATE_FORMATS,
+    LOAD_TARGETS,
+    SCHEMA,
+    copy_features,
+    retarget_schema,
+    target_path,
+)
+from zip_source import open_source
+
+logger = logging.getLogger(__name__)
+
+ATTR_SQL = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "04_bulk_attribute_import.sql"
+)
+DB_WORKERS = 4  # Connections (and threads) used for independent steps
+# Sources that are not GeoJSON features, with the function that COPYs them
+GRAPH_SOURCES = {"cell_edges": copy_edges}
+
+_STEP_RE = re.compile(r"^-- @step (\S+)[ \t]*$", re.MULTILINE)
+_AFTER_RE = re.compile(r"^-- @after (.+)$", re.MULTILINE)
+_PSQL_COPY_RE = re.compile(
+    r"^\\copy\s+(.+?)\s+FROM\s+'([^']+)'\s*(.*?)\s*;?\s*$", re.IGNORECASE
+)
+
+
+def _has_sql(lines):
+    return any(line.strip() and not line.lstrip().startswith("--") for line in lines)
+
+
+def run_sql_block(cur, sql, files=None):
+    """
+    Executes a block of the attribute SQL. psql's client-side \\copy lines are
+    turned into COPY ... FROM STDIN fed from the local file, or from
+    files[path] when a replacement is given (e.g. only the changed rows, or
+    a zip_source.ZipMember streamed out of the upload).
+    """
+    pending = []
+    for line in sql.splitlines(keepends=True):
+        match = _PSQL_COPY_RE.match(line)
+        if match is None:
+            pending.append(line)
+            continue
+        if _has_sql(pending):
+            cur.execute("".join(pending))
+        pending = []
+        table, path, options = match.groups()
+        source = (files or {}).get(path, path)
+        with open_source(source) as f:
+            cur.copy_expert(f"COPY {table} FROM STDIN {options}", f)
+    if _has_sql(pending):
+        cur.execute("".join(pending))
+
+
+def parse_sql_steps(sql_file=ATTR_SQL, schema=SCHEMA, files=None):
+    """
+    Splits the attribute SQL at its "-- @step" markers. Returns
+    {name: (after, func(cur))}; the text before the first step (search_path)
+    is prepended to every block since each may run on a different connection.
+    """
+    with open(sql_file, "r", encoding="utf-8") as f:
+        parts = _STEP_RE.split(retarget_schema(f.read(), schema))
+    preamble = parts[0]
+    steps = {}
+    for name, body in zip(parts[1::2], parts[2::2]):
+        after = [
+            dep.strip() for line in _AFTER_RE.findall(body) for dep in line.split(",")
+        ]
+        steps[name] = (
+            after,
+            partial(run_sql_block, sql=preamble + body, files=files),
+        )
+    return steps
+
+
+def _load_step(name, data, schema, truncate):
+    if name in GRAPH_SOURCES:
+        return partial(
+            GRAPH_SOURCES[name], graph=data, schema=schema, truncate=truncate
+        )
+    return partial(
+        copy_features,
+        features=data,
+        target=LOAD_TARGETS[name],
+        schema=schema,
+        truncate=truncate,
+    )
+
+
+def _prepared(prepare, func, cur):
+    prepare(cur)
+    return func(cur)
+
+
+def build_steps(
+    sources, sql_file=ATTR_SQL, schema=SCHEMA, files=None, append=(), prepare=None
+):
+    """
+    Geometry COPY steps ("load:<name>") for the sources plus the SQL blocks.
+    Sources named in `append` are added to their table instead of replacing it.
+    `prepare` maps step names to func(cur) run first in that step's
+    transaction, e.g. to delete the rows the step is about to re-add.
+    """
+    steps = {
+        f"load:{name}": ([], _load_step(name, data, schema, name not in append))
+        for name, data in sources.items()
+    }
+    steps.update(parse_sql_steps(sql_file, schema, files))
+    for name, func in (prepare or {}).items():
+        if name not in steps:
+            raise ValueError(f"Cannot prepare unknown step {name}")
+        after, step = steps[name]
+        steps[name] = (after, partial(_prepared, func, step))
+    return steps
+
+
+def run_steps(pg_url, steps, workers=DB_WORKERS):
+    """
+    Runs {name: (after, func(cur))} steps as soon as everything they come
+    after has finished, at most `workers` at a time, each in its own
+    transaction on a pooled connection. Returns {name: (seconds, rows)}.
+    """
+    for name, (after, _) in steps.items():
+        for dep in after:
+            # A geometry load that was not requested is treated as done
+            if dep not in steps and not dep.startswith("load:"):
+                raise ValueError(f"Step {name} comes after unknown step {dep}")
+
+    pool = ThreadedConnectionPool(1, workers, pg_url)
+
+    def run(name):
+        conn = pool.getconn()
+        try:
+            start = time.perf_counter()
+            with conn:
+                with conn.cursor() as cur:
+                    rows = steps[name][1](cur)
+            return time.perf_counter() - start, rows
+        finally:
+            pool.putconn(conn)
+
+    results = {}
+    pending = dict(steps)
+    running = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or running:
+                for name in [
+                    n
+                    for n, (after, _) in pending.items()
+                    if all(dep in results or dep not in steps for dep in after)
+                ]:
+                    del pending[name]
+                    running[executor.submit(run, name)] = name
+                    logger.info(f"Started import step {name}")
+                if not running:
+                    raise ValueError(
+                        f"Dependency cycle between steps: {sorted(pending)}"
+                    )
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception:
+                        logger.exception(f"Import step {name} failed")
+                        pending.clear()
+                        for queued in running:
+                            queued.cancel()
+                        raise
+                    seconds, rows = results[name]
+                    logger.info(
+                        f"[{len(results)}/{len(steps)}] {name} done in {seconds:.2f}s"
+                        + (f" ({rows} rows)" if rows is not None else "")
+                    )
+    finally:
+        pool.closeall()
+    return results
+
+
+def run_import(
+    pg_url,
+    sources,
+    sql_file=ATTR_SQL,
+    workers=DB_WORKERS,
+    schema=SCHEMA,
+    files=None,
+    append=(),
+    prepare=None,
+):
+    """Loads the geometry sources and runs the attribute SQL, in parallel where possible."""
+    start = time.perf_counter()
+    steps = build_steps(sources, sql_file, schema, files, append, prepare)
+    results = run_steps(pg_url, steps, workers)
+    logger.info(
+        f"Import finished: {len(results)} steps in {time.perf_counter() - start:.2f}s "
+        f"on {workers} connections"
+    )
+    return results
+
+
+def table_row_counts(pg_url, schema=SCHEMA):
+    """{table: rows} for every table of the imported schema, after the import."""
+    counts = {}
+    conn = psycopg2.connect(pg_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT tablename FROM pg_tables WHERE schemaname = %s ORDER BY tablename",
+                (schema,),
+            )
+            for (table,) in cur.fetchall():
+                cur.execute(
+                    sql.SQL("SELECT count(*) FROM {}.{}").format(
+                        sql.Identifier(schema), sql.Identifier(table)
+                    )
+                )
+                counts[f"{schema}.{table}"] = cur.fetchone()[0]
+    finally:
+        conn.close()
+    return counts
+
+
+def print_results(results):
+    for name, (seconds, rows) in results.items():
+        print(
+            f"{name}: {seconds:.2f}s" + (f", {rows} rows" if rows is not None else "")
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename="data-loader.log",
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    parser = argparse.ArgumentParser(
+        description="Load cleaned GeoJSON/GeoParquet and run the attribute SQL in parallel."
+    )
+    parser.add_argument("--pg-url", default=os.environ.get("PG_DB_URL"))
+    parser.add_argument("--workers", type=int, default=DB_WORKERS)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument(
+        "--intermediate",
+        choices=INTERMEDIATE_FORMATS,
+        default=INTERMEDIATE_FORMAT,
+        help="Format 02_extract_and_clean.py wrote the cleaned files in "
+        "(default: INTERMEDIATE_FORMAT or geojson).",
+    )
+    args = parser.parse_args()
+    if not args.pg_url:
+        parser.error("--pg-url or PG_DB_URL is required")
+    try:
+        sources = {
+            name: iter_features(target_path(args.data_dir, target, args.intermediate))
+            for name, target in LOAD_TARGETS.items()
+        }
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    graph_file = os.path.join(args.data_dir, os.path.basename(CELL_GRAPH_FILE))
+    if os.path.exists(graph_file):
+        sources["cell_edges"] = load_csr(graph_file)
+    print_results(run_import(args.pg_url, sources, workers=args.workers))
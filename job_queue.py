@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+JOB_DB = "/srv/data-loader/jobs.sqlite"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SUPERSEDED = "superseded"
+
+
+class JobQueue:
+    """
+    Durable import queue in a SQLite file. Every upload is a job for a map;
+    jobs of different maps can run at the same time, jobs of one map run one
+    after the other and only its newest queued upload is imported.
+    """
+
+    def __init__(self, path=JOB_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    map TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    version TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, map)")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as db:
+            db.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+            )
+
+    def enqueue(self, map_id, path, version=None):
+        now = time.time()
+        with closing(self._connect()) as db:
+            cur = db.execute(
+                "INSERT INTO jobs (map, path, version, status, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (map_id, path, version, QUEUED, now, now),
+            )
+            return cur.lastrowid
+
+    def claim(self):
+        """
+        Marks the newest queued job of a map with nothing running as running.
+        Returns (job, superseded jobs of the same map), or (None, []) if no
+        job can start.
+        """
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                job = db.execute(
+                    """
+                    SELECT * FROM jobs j
+                    WHERE status = ?
+                      AND NOT EXISTS (
+                          SELECT 1 FROM jobs r WHERE r.map = j.map AND r.status = ?
+                      )
+                    ORDER BY id DESC
+                    LIMIT 1
+                    """,
+                    (QUEUED, RUNNING),
+                ).fetchone()
+                if job is None:
+                    db.execute("COMMIT")
+                    return None, []
+                superseded = db.execute(
+                    "SELECT * FROM jobs WHERE map = ? AND status = ? AND id < ?",
+                    (job["map"], QUEUED, job["id"]),
+                ).fetchall()
+                now = time.time()
+                db.execute(
+                    "UPDATE jobs SET status = ?, updated = ? "
+                    "WHERE map = ? AND status = ? AND id < ?",
+                    (SUPERSEDED, now, job["map"], QUEUED, job["id"]),
+                )
+                db.execute(
+                    "UPDATE jobs SET status = ?, updated = ? WHERE id = ?",
+                    (RUNNING, now, job["id"]),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return dict(job), [dict(row) for row in superseded]
+
+    def set_stage(self, job_id, stage):
+        self._update(job_id, stage=stage)
+
+    def finish(self, job_id, error=None):
+        self._update(job_id, status=FAILED if error else DONE, error=error)
+
+    def recover(self):
+        """Puts jobs left running by a watcher that stopped back in the queue."""
+        with closing(self._connect()) as db:
+            return db.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE status = ?",
+                (QUEUED, time.time(), RUNNING),
+            ).rowcount
+
+    def pending(self):
+        with closing(self._connect()) as db:
+            return db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()[0]
@@ -0,0 +1,218 @@
+import cProfile
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = os.environ.get("METRICS_FILE", "/srv/data-loader/metrics.jsonl")
+# Directory scraped by node_exporter's textfile collector (unset = no .prom files)
+PROM_TEXTFILE_DIR = os.environ.get("PROM_TEXTFILE_DIR")
+# Directory for a cProfile dump per run (unset = no profiling)
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
+
+# Seconds between RSS samples while a stage runs
+RSS_SAMPLE_INTERVAL = float(os.environ.get("RSS_SAMPLE_INTERVAL", "0.05"))
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _maxrss_bytes(who):
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS, KiB elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far (a lifetime high-water mark)."""
+    return _maxrss_bytes(resource.RUSAGE_SELF)
+
+
+def children_peak_rss_bytes():
+    """Peak RSS of the largest child process (pool worker, subprocess) reaped so far."""
+    return _maxrss_bytes(resource.RUSAGE_CHILDREN)
+
+
+def current_rss_bytes():
+    """Resident set size of this process right now; the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss_bytes()
+
+
+class RssSampler:
+    """
+    Peak RSS of this process while the block runs. ru_maxrss only ever grows,
+    so in a long-lived process (the watcher) it says nothing about a single
+    stage; this samples the current RSS from a background thread instead
+    (every RSS_SAMPLE_INTERVAL seconds, so briefer spikes can be missed).
+    When the block raises the process-wide peak, that exact value is used.
+    Pool workers and subprocesses are counted through RUSAGE_CHILDREN once
+    they have been reaped, and only when one of them beat the earlier ones.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self.children_peak = None
+        self._done = threading.Event()
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __enter__(self):
+        self._start_peak = peak_rss_bytes()
+        self._start_children = children_peak_rss_bytes()
+        self.peak = current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+        if peak_rss_bytes() > self._start_peak:
+            self.peak = max(self.peak, peak_rss_bytes())
+        children = children_peak_rss_bytes()
+        if children > self._start_children:
+            self.children_peak = children
+        return False
+
+
+class Metrics:
+    """
+    Collects per-stage timings, peak RSS and row counts of one run. Every
+    record is appended to a JSON-lines file as soon as it is known; the
+    totals can also be written as a Prometheus textfile.
+    """
+
+    def __init__(self, job, run_id=None, path=METRICS_FILE):
+        self.job = job
+        self.run_id = run_id or time.strftime("%Y%m%dT%H%M%S")
+        self.path = path
+        self.stages = {}
+        self.rows = {}
+
+    def record(self, stage, **fields):
+        entry = {"ts": time.time(), "job": self.job, "run": self.run_id, "stage": stage}
+        entry.update(fields)
+        if "seconds" in fields:
+            self.stages[stage] = entry
+        if fields.get("rows") is not None:
+            self.rows[stage] = fields["rows"]
+        if self.path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self.path}: {e}")
+        return entry
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        Times the block and records it with the peak RSS it reached, plus the
+        peak of the child processes it ran where one set a new high.
+        """
+        start = time.perf_counter()
+        status = "failed"
+        rss = RssSampler()
+        try:
+            with rss:
+                yield
+            status = "ok"
+        finally:
+            if rss.children_peak is not None:
+                fields.setdefault("children_peak_rss_bytes", rss.children_peak)
+            self.record(
+                name,
+                seconds=round(time.perf_counter() - start, 4),
+                peak_rss_bytes=rss.peak,
+                status=status,
+                **fields,
+            )
+
+    def peak_rss(self):
+        """Highest stage peak of this run (the current RSS before any stage ran)."""
+        return max(
+            (
+                e["peak_rss_bytes"]
+                for e in self.stages.values()
+                if "peak_rss_bytes" in e
+            ),
+            default=current_rss_bytes(),
+        )
+
+    def write_prometheus(self, directory=PROM_TEXTFILE_DIR):
+        """Writes data_loader_<job>.prom atomically into `directory` (if set)."""
+        if not directory:
+            return
+        lines = [
+            "# TYPE data_loader_stage_seconds gauge",
+            *(
+                f'data_loader_stage_seconds{{job="{self.job}",stage="{stage}"}} '
+                f'{entry["seconds"]}'
+                for stage, entry in self.stages.items()
+            ),
+            "# TYPE data_loader_stage_success gauge",
+            *(
+                f'data_loader_stage_success{{job="{self.job}",stage="{stage}"}} '
+                f'{int(entry["status"] == "ok")}'
+                for stage, entry in self.stages.items()
+                if "status" in entry
+            ),
+            "# TYPE data_loader_rows gauge",
+            *(
+                f'data_loader_rows{{job="{self.job}",stage="{stage}"}} {rows}'
+                for stage, rows in self.rows.items()
+            ),
+            "# TYPE data_loader_stage_peak_rss_bytes gauge",
+            *(
+                f'data_loader_stage_peak_rss_bytes{{job="{self.job}",stage="{stage}"}} '
+                f'{entry["peak_rss_bytes"]}'
+                for stage, entry in self.stages.items()
+                if "peak_rss_bytes" in entry
+            ),
+            "# TYPE data_loader_peak_rss_bytes gauge",
+            f'data_loader_peak_rss_bytes{{job="{self.job}"}} {self.peak_rss()}',
+            "# TYPE data_loader_last_run_timestamp_seconds gauge",
+            f'data_loader_last_run_timestamp_seconds{{job="{self.job}"}} {time.time():.0f}',
+        ]
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, os.path.join(directory, f"data_loader_{self.job}.prom"))
+        except OSError as e:
+            logger.warning(f"Could not write Prometheus textfile to {directory}: {e}")
+
+
+@contextmanager
+def profiled(name, directory=PROFILE_DIR):
+    """Dumps a cProfile of the block to directory/<name>-<time>.prof when directory is set."""
+    if not directory:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%dT%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        logger.info(f"Wrote profile to {path} (view with python -m pstats or snakeviz)")
@@ -0,0 +1,284 @@
+import io
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import time
+
+import numpy as np
+import psycopg2
+import shapely
+from shapely.geometry import shape
+
+from geojson_utils import iter_features
+from geoparquet import PARQUET_EXTENSION
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "/srv/data-loader/data"
+BATCH_SIZE = 5000  # Features encoded per vectorized WKB call
+# File formats the extractor writes the cleaned files in (--intermediate), and
+# the one the command-line loaders read unless told otherwise
+INTERMEDIATE_FORMATS = ("geojson", "geoparquet")
+INTERMEDIATE_FORMAT = os.environ.get("INTERMEDIATE_FORMAT", "geojson").lower()
+
+SCHEMA = "spatial"
+# What 03_ogr2ogr_import.sh used to load, into the tables from 01_spatial_schema.sql
+# (created in SCHEMA, or in a staging schema by schema_swap).
+# id: "int" / "text" keep the feature id, "serial" numbers rows 1..n like
+# ogr2ogr does for sources without a unique id (land parts share their land id).
+# srid: SRID of the geom column; rivers stay in pixel space (0), like the
+# rivers layer of tile_pyramid.LAYERS.
+LOAD_TARGETS = {
+    "rivers": {
+        "table": "rivers_geom",
+        "geometry": "LineString",
+        "id": "int",
+        "srid": 0,
+        "file": "openheim_rivers_cleaned.geojson",
+    },
+    "routes": {
+        "table": "routes_geom_staging",
+        "geometry": "LineString",
+        "id": "text",
+        "srid": 4326,
+        "file": "routes.geojson",
+    },
+    "cells": {
+        "table": "cells_geom_staging",
+        "geometry": "Polygon",
+        "id": "int",
+        "srid": 4326,
+        "file": "cells.geojson",
+    },
+    "land": {
+        "table": "landmass_staging",
+        "geometry": "MultiPolygon",
+        "id": "serial",
+        "srid": 4326,
+        "file": "openheim_land_cleaned.geojson",
+        "type_column": True,
+    },
+}
+
+_SPATIAL_SCHEMA_RE = re.compile(r"\bspatial\b(?=\s*[.,])")
+
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack("!h", -1)
+_NULL_FIELD = struct.pack("!i", -1)
+_JSONB_VERSION = b"\x01"
+_MULTI_OF = {"MultiPolygon": "Polygon", "MultiLineString": "LineString"}
+_MULTI_MAKER = {
+    "MultiPolygon": shapely.multipolygons,
+    "MultiLineString": shapely.multilinestrings,
+}
+
+
+def _field(value):
+    if value is None:
+        return _NULL_FIELD
+    return struct.pack("!i", len(value)) + value
+
+
+def _encode_id(value, id_type):
+    if value is None:
+        return None
+    if id_type == "text":
+        return str(value).encode("utf-8")
+    return struct.pack("!i", int(value))
+
+
+def _coerce_geometries(geoms, geometry_type):
+    """
+    Casts geometries to the column type the way ogr2ogr -nlt does: single
+    parts are promoted to multi, single-member multis are unwrapped.
+    """
+    wanted = shapely.GeometryType[geometry_type.upper()]
+    types = shapely.get_type_id(geoms)
+    if geometry_type in _MULTI_OF:
+        promote = types == shapely.GeometryType[_MULTI_OF[geometry_type].upper()]
+        if promote.any():
+            geoms[promote] = _MULTI_MAKER[geometry_type](geoms[promote].reshape(-1, 1))
+    else:
+        unwrap = (types >= shapely.GeometryType.MULTIPOINT) & (
+            shapely.get_num_geometries(geoms) == 1
+        )
+        if unwrap.any():
+            geoms[unwrap] = shapely.get_geometry(geoms[unwrap], 0)
+    types = shapely.get_type_id(geoms)
+    bad = (types != wanted) & (types != -1)  # -1: missing geometry, loaded as NULL
+    if bad.any():
+        raise ValueError(
+            f"Cannot load {geoms[bad][0].geom_type} into a {geometry_type} column"
+        )
+    return geoms
+
+
+def _feature_batches(features):
+    """(geometries, properties, ids) per BATCH_SIZE GeoJSON features."""
+    batch = []
+
+    def split(batch):
+        geoms = np.array(
+            [shape(f["geometry"]) if f.get("geometry") else None for f in batch],
+            dtype=object,
+        )
+        return (
+            geoms,
+            [f.get("properties") or {} for f in batch],
+            [f.get("id") for f in batch],
+        )
+
+    for feat in features:
+        batch.append(feat)
+        if len(batch) == BATCH_SIZE:
+            yield split(batch)
+            batch = []
+    if batch:
+        yield split(batch)
+
+
+def iter_copy_rows(features, target):
+    """
+    Yields PGCOPY binary data for the features: an int/text id, the geometry
+    as EWKB with the target's SRID, the feature properties as jsonb and optionally `type`.
+    Sources with batches() (GeoParquet) hand over their geometries as they
+    are, without a GeoJSON round trip.
+    """
+    yield _PGCOPY_HEADER
+    n_fields = 4 if target.get("type_column") else 3
+    field_count = struct.pack("!h", n_fields)
+    row_number = 0
+
+    batches = (
+        features.batches()
+        if hasattr(features, "batches")
+        else _feature_batches(features)
+    )
+    for geoms, props_list, ids in batches:
+        geoms = shapely.set_srid(
+            _coerce_geometries(geoms, target["geometry"]), target["srid"]
+        )
+        wkbs = shapely.to_wkb(geoms, include_srid=True)
+        out = []
+        for props, feature_id, wkb in zip(props_list, ids, wkbs):
+            row_number += 1
+            if target["id"] == "serial":
+                row_id = _encode_id(row_number, "int")
+            else:
+                row_id = _encode_id(props.get("id", feature_id), target["id"])
+            fields = [
+                row_id,
+                wkb,
+                _JSONB_VERSION + json.dumps(props, separators=(",", ":")).encode(),
+            ]
+            if target.get("type_column"):
+                fields.append(
+                    None if props.get("type") is None else str(props["type"]).encode()
+                )
+            out.append(field_count + b"".join(_field(v) for v in fields))
+        yield b"".join(out)
+    yield _PGCOPY_TRAILER
+
+
+class _ChunkReader(io.RawIOBase):
+    """File-like view of an iterator of bytes chunks, for cursor.copy_expert."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def retarget_schema(sql, schema):
+    """Points the "spatial." references (and search_path entry) of SQL at `schema`."""
+    return _SPATIAL_SCHEMA_RE.sub(schema, sql)
+
+
+def copy_features(cur, features, target, schema=SCHEMA, truncate=True):
+    """
+    Replaces the contents of the target table with the features via binary
+    COPY (or appends them with truncate=False).
+    """
+    table = f"{schema}.{target['table']}"
+    columns = "id, geom, geojsondata" + (", type" if target.get("type_column") else "")
+    if truncate:
+        cur.execute(f"TRUNCATE {table}")
+    cur.copy_expert(
+        f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT binary)",
+        io.BufferedReader(_ChunkReader(iter_copy_rows(features, target))),
+    )
+    return cur.rowcount
+
+
+def load_features(pg_url, sources, schema=SCHEMA):
+    """
+    Loads {target name: iterable of features} over a single connection in one
+    transaction. Returns {table: row count}.
+    """
+    counts = {}
+    with psycopg2.connect(pg_url) as conn:
+        with conn.cursor() as cur:
+            for name, features in sources.items():
+                table = f"{schema}.{LOAD_TARGETS[name]['table']}"
+                start = time.perf_counter()
+                counts[table] = copy_features(cur, features, LOAD_TARGETS[name], schema)
+                logger.info(
+                    f"Loaded {counts[table]} rows into {table} "
+                    f"in {time.perf_counter() - start:.2f}s"
+                )
+    conn.close()
+    return counts
+
+
+def target_path(data_dir, target, intermediate):
+    """
+    The cleaned file of a load target in data_dir, in the format the extractor
+    wrote (--intermediate): its GeoJSON, or the .parquet for "geoparquet".
+    Raises FileNotFoundError when that file is not there.
+    """
+    if intermediate not in INTERMEDIATE_FORMATS:
+        raise ValueError(f"Unknown intermediate format: {intermediate}")
+    path = os.path.join(data_dir, target["file"])
+    if intermediate == "geoparquet":
+        path = os.path.splitext(path)[0] + PARQUET_EXTENSION
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {intermediate} file for {target['table']}: {path}")
+    return path
+
+
+def load_files(pg_url, data_dir=DATA_DIR, names=None, intermediate=INTERMEDIATE_FORMAT):
+    """Loads the cleaned files in data_dir, written as `intermediate`, streaming them from disk."""
+    sources = {
+        name: iter_features(target_path(data_dir, LOAD_TARGETS[name], intermediate))
+        for name in names or LOAD_TARGETS
+    }
+    return load_features(pg_url, sources)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename="data-loader.log",
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    pg_url = os.environ.get("PG_DB_URL")
+    if pg_url is None:
+        raise ValueError("PG_DB_URL environment variable must not be None")
+    for table, count in load_files(pg_url, names=sys.argv[1:] or None).items():
+        print(f"{table}: {count} rows")
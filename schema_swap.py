@@ -0,0 +1,298 @@
+import logging
+import os
+import re
+import time
+
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+
+from import_scheduler import ATTR_SQL, DB_WORKERS, run_import
+from pg_loader import SCHEMA, retarget_schema
+
+logger = logging.getLogger(__name__)
+
+DDL_SQL = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "01_spatial_schema.sql"
+)
+PREVIOUS_SCHEMA = f"{SCHEMA}_previous"  # Last live schema, kept for a quick rollback
+SWAP_LOCK_TIMEOUT = "30s"  # Give up the swap rather than queue behind long readers
+
+_INDEX_RE = re.compile(r"^\s*CREATE\s+(UNIQUE\s+)?INDEX\b", re.IGNORECASE)
+
+
+def swap_enabled():
+    return os.environ.get("SCHEMA_SWAP", "").lower() in ("1", "true", "yes", "on")
+
+
+def staging_schema_name(version):
+    """spatial_<version> with anything but [A-Za-z0-9_] replaced, e.g. spatial_0_0_7."""
+    return f"{SCHEMA}_{re.sub(r'[^0-9A-Za-z_]', '_', str(version))}"
+
+
+def split_ddl(ddl):
+    """
+    Splits DDL into (statements, index statements) so the indexes can be
+    built once after the bulk load instead of being maintained row by row.
+    """
+    statements, indexes = [], []
+    for statement in ddl.split(";"):
+        code = "\n".join(
+            line for line in statement.splitlines() if not line.strip().startswith("--")
+        )
+        if not code.strip():
+            continue
+        (indexes if _INDEX_RE.match(code) else statements).append(statement.strip())
+    return statements, indexes
+
+
+def drop_schema(cur, schema):
+    """
+    Drops `schema` without CASCADE: its views and tables go in one statement
+    each, then the schema itself. If anything outside the schema (a view, a
+    foreign key) still depends on them, PostgreSQL refuses and the error is
+    raised instead of that object being dropped along with it.
+    """
+    cur.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s", (schema,))
+    if not cur.fetchone():
+        return
+    for kinds, keyword in (
+        (("v",), "VIEW"),
+        (("m",), "MATERIALIZED VIEW"),
+        (("r", "p"), "TABLE"),
+    ):
+        cur.execute(
+            """
+            SELECT c.relname FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relkind = ANY(%s) AND NOT c.relispartition
+            ORDER BY c.relname
+            """,
+            (schema, list(kinds)),
+        )
+        names = [sql.Identifier(schema, name) for (name,) in cur.fetchall()]
+        if names:
+            cur.execute(
+                sql.SQL("DROP {} {}").format(
+                    sql.SQL(keyword), sql.SQL(", ").join(names)
+                )
+            )
+    cur.execute(sql.SQL("DROP SCHEMA {}").format(sql.Identifier(schema)))
+
+
+def copy_privileges(cur, source, target):
+    """
+    Grants on `target` what is granted on `source`: the schema ACL, the
+    default privileges defined in it and the ACL of every table, view and
+    sequence both schemas have. The staging schema is built from the DDL
+    alone, so without this readers on other roles would lose access as
+    soon as it is swapped in.
+    """
+    # Grantee 0 is PUBLIC, which has no pg_roles row
+    grantee_sql = "(SELECT rolname FROM pg_roles WHERE oid = a.grantee)"
+
+    def to(grantee):
+        return sql.SQL("PUBLIC") if grantee is None else sql.Identifier(grantee)
+
+    def option(grantable):
+        return sql.SQL(" WITH GRANT OPTION" if grantable else "")
+
+    cur.execute(
+        f"""
+        SELECT a.privilege_type, {grantee_sql}, a.is_grantable
+        FROM pg_namespace n, aclexplode(n.nspacl) a
+        WHERE n.nspname = %s AND a.grantee <> n.nspowner
+        """,
+        (source,),
+    )
+    for privilege, grantee, grantable in cur.fetchall():
+        cur.execute(
+            sql.SQL("GRANT {} ON SCHEMA {} TO {}{}").format(
+                sql.SQL(privilege),
+                sql.Identifier(target),
+                to(grantee),
+                option(grantable),
+            )
+        )
+
+    object_kinds = {"r": "TABLES", "S": "SEQUENCES", "f": "FUNCTIONS", "T": "TYPES"}
+    cur.execute(
+        f"""
+        SELECT (SELECT rolname FROM pg_roles WHERE oid = d.defaclrole), d.defaclobjtype,
+               a.privilege_type, {grantee_sql}, a.is_grantable
+        FROM pg_default_acl d
+        JOIN pg_namespace n ON n.oid = d.defaclnamespace,
+        aclexplode(d.defaclacl) a
+        WHERE n.nspname = %s
+        """,
+        (source,),
+    )
+    for role, kind, privilege, grantee, grantable in cur.fetchall():
+        cur.execute(
+            sql.SQL(
+                "ALTER DEFAULT PRIVILEGES FOR ROLE {} IN SCHEMA {} GRANT {} ON {} TO {}{}"
+            ).format(
+                sql.Identifier(role),
+                sql.Identifier(target),
+                sql.SQL(privilege),
+                sql.SQL(object_kinds[kind]),
+                to(grantee),
+                option(grantable),
+            )
+        )
+
+    cur.execute(
+        f"""
+        SELECT c.relname, c.relkind, a.privilege_type, {grantee_sql}, a.is_grantable
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace,
+        aclexplode(c.relacl) a
+        WHERE n.nspname = %s AND c.relkind IN ('r', 'p', 'v', 'm', 'S')
+          AND a.grantee <> c.relowner
+          AND EXISTS (
+              SELECT 1 FROM pg_class t
+              JOIN pg_namespace tn ON tn.oid = t.relnamespace
+              WHERE tn.nspname = %s AND t.relname = c.relname AND t.relkind = c.relkind
+          )
+        """,
+        (source, target),
+    )
+    for name, kind, privilege, grantee, grantable in cur.fetchall():
+        cur.execute(
+            sql.SQL("GRANT {} ON {} {} TO {}{}").format(
+                sql.SQL(privilege),
+                sql.SQL("SEQUENCE" if kind == "S" else "TABLE"),
+                sql.Identifier(target, name),
+                to(grantee),
+                option(grantable),
+            )
+        )
+
+    cur.execute(
+        """
+        SELECT c.relname FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+        EXCEPT
+        SELECT c.relname FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s
+        ORDER BY 1
+        """,
+        (source, target),
+    )
+    missing = [name for (name,) in cur.fetchall()]
+    if missing:
+        logger.warning(
+            f"{source} has relations the DDL does not create, they will not be "
+            f"in the new {SCHEMA}: {', '.join(missing)}"
+        )
+
+
+def create_staging_schema(conn, schema, ddl_file=DDL_SQL):
+    """(Re)creates `schema` with the tables from the DDL but without indexes."""
+    with open(ddl_file, "r", encoding="utf-8") as f:
+        statements, indexes = split_ddl(retarget_schema(f.read(), schema))
+    with conn.cursor() as cur:
+        drop_schema(cur, schema)
+        cur.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(schema)))
+        for statement in statements:
+            cur.execute(statement)
+    conn.commit()
+    logger.info(f"Created staging schema {schema} ({len(indexes)} indexes deferred)")
+    return indexes
+
+
+def build_indexes_and_analyze(conn, schema, indexes):
+    with conn.cursor() as cur:
+        for statement in indexes:
+            start = time.perf_counter()
+            cur.execute(statement)
+            logger.info(
+                f"{statement.splitlines()[0]} in {time.perf_counter() - start:.2f}s"
+            )
+        cur.execute(
+            "SELECT tablename FROM pg_tables WHERE schemaname = %s ORDER BY tablename",
+            (schema,),
+        )
+        for (table,) in cur.fetchall():
+            cur.execute(
+                sql.SQL("ANALYZE {}.{}").format(
+                    sql.Identifier(schema), sql.Identifier(table)
+                )
+            )
+    conn.commit()
+    logger.info(f"Built {len(indexes)} indexes and analyzed {schema}")
+
+
+def swap_schema(conn, schema, live=SCHEMA, previous=PREVIOUS_SCHEMA):
+    """
+    Makes `schema` the live one in a single transaction: live -> previous,
+    staging -> live. Readers see either the old or the new tables, never
+    an empty or half-loaded one. The live schema's privileges are copied
+    onto `schema` first. Dropping the old previous generation fails (and
+    the swap with it) if something outside it still depends on it.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+        try:
+            drop_schema(cur, previous)
+        except psycopg2.errors.DependentObjectsStillExist as e:
+            logger.error(
+                f"Cannot drop {previous}, other objects depend on it: "
+                f"{e.diag.message_detail}"
+            )
+            raise
+        cur.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s", (live,))
+        if cur.fetchone():
+            copy_privileges(cur, live, schema)
+            cur.execute(
+                sql.SQL("ALTER SCHEMA {} RENAME TO {}").format(
+                    sql.Identifier(live), sql.Identifier(previous)
+                )
+            )
+        cur.execute(
+            sql.SQL("ALTER SCHEMA {} RENAME TO {}").format(
+                sql.Identifier(schema), sql.Identifier(live)
+            )
+        )
+    conn.commit()
+    logger.info(f"Swapped {schema} in as {live} (old tables kept in {previous})")
+
+
+def import_with_swap(
+    pg_url,
+    sources,
+    version,
+    workers=DB_WORKERS,
+    ddl_file=DDL_SQL,
+    sql_file=ATTR_SQL,
+    files=None,
+):
+    """
+    Loads into spatial_<version> with no indexes, builds the GiST indexes and
+    ANALYZEs once at the end, then swaps the schema in atomically. `files`
+    is passed on to run_import.
+    """
+    schema = staging_schema_name(version)
+    conn = psycopg2.connect(pg_url)
+    try:
+        indexes = create_staging_schema(conn, schema, ddl_file)
+        try:
+            results = run_import(pg_url, sources, sql_file, workers, schema, files)
+            build_indexes_and_analyze(conn, schema, indexes)
+            swap_schema(conn, schema)
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Import into {schema} failed; {SCHEMA} left untouched")
+            try:
+                with conn.cursor() as cur:
+                    drop_schema(cur, schema)
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                logger.exception(f"Could not drop the staging schema {schema}")
+            raise
+    finally:
+        conn.close()
+    return results
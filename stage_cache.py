@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from geojson_utils import feature_writer
+from zip_source import source_exists, source_sha256
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = "/srv/data-loader/cache"
+# Bump when extraction/cleaning output changes so old entries stop matching
+PIPELINE_VERSION = "2"
+CACHE_MAX_ENTRIES = 50
+CACHE_MAX_BYTES = 2 * 1024**3
+
+
+class StageCache:
+    """
+    Content-addressed store of stage outputs. An entry is a directory named
+    after the SHA-256 of the stage name, PIPELINE_VERSION, the stage config
+    and the SHA-256 of every input (a file or a zip_source.ZipMember); its
+    mtime is refreshed on each hit so evict() can drop the least recently
+    used entries.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, stage, inputs, config=None):
+        """Returns the entry key, or None if an input is missing (not cacheable)."""
+        if not all(source_exists(source) for source in inputs):
+            return None
+        payload = {
+            "stage": stage,
+            "version": PIPELINE_VERSION,
+            "config": config or {},
+            "inputs": [source_sha256(source) for source in inputs],
+        }
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def entry(self, key):
+        """Path of the entry directory on a hit (marking it used), else None."""
+        if key is None:
+            return None
+        path = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path)
+        return path
+
+    def restore(self, key, outputs):
+        """Copies a hit's files to the output paths. Returns True on a hit."""
+        path = self.entry(key)
+        if path is None:
+            return False
+        for out in outputs:
+            shutil.copyfile(os.path.join(path, os.path.basename(out)), out)
+        return True
+
+    def store(self, key, files=None, features=None):
+        """
+        Adds an entry from output files and/or {name: features} (written as
+        compact GeoJSON, or GeoParquet for .parquet names). The entry appears
+        atomically or not at all.
+        """
+        if key is None:
+            return
+        tmp = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for src in files or []:
+                shutil.copyfile(src, os.path.join(tmp, os.path.basename(src)))
+            for name, feats in (features or {}).items():
+                with feature_writer(os.path.join(tmp, name)) as writer:
+                    writer.write_many(feats)
+            target = os.path.join(self.cache_dir, key)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.rename(tmp, target)
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    def run(self, stage, inputs, outputs, func, config=None):
+        """
+        Restores `outputs` on a hit, otherwise runs func() and stores them.
+        For in-place stages (outputs == inputs) the result is also stored
+        under its own hash, so running again on already processed files is a
+        hit rather than a second pass. Returns True on a hit.
+        """
+        key = self.key(stage, inputs, config)
+        if self.restore(key, outputs):
+            logger.info(f"Stage cache hit for {stage}: {', '.join(outputs)}")
+            return True
+        func()
+        if key is not None and all(os.path.exists(out) for out in outputs):
+            self.store(key, files=outputs)
+            if inputs == outputs:
+                self.store(self.key(stage, outputs, config), files=outputs)
+        return False
+
+    def evict(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        """Drops least recently used entries beyond max_entries / max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(path):
+                continue
+            if name.startswith(".tmp-"):
+                # Left behind by an interrupted store()
+                if time.time() - os.path.getmtime(path) > 3600:
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        entries.sort(reverse=True)
+
+        removed, total = 0, 0
+        for i, (_, size, path) in enumerate(entries):
+            total += size
+            if i >= max_entries or total > max_bytes:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Evicted {removed} stage cache entries from {self.cache_dir}")
+        return removed
@@ -0,0 +1,95 @@
+import importlib
+import logging
+import subprocess
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from db_utils import connection
+
+logger = logging.getLogger(__name__)
+
+CLEAN_MODULE = "02_extract_and_clean"
+OUTPUT_TAIL_LINES = 50  # Lines of a failed command's output kept for the error
+
+
+class StageRunner:
+    """
+    Times the stages of one import and logs each as it finishes; with a
+    metrics.Metrics they are also recorded with their peak RSS.
+    """
+
+    def __init__(self, log=logger.info, metrics=None):
+        self.log = log
+        self.metrics = metrics
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            with self.metrics.stage(name) if self.metrics else nullcontext():
+                yield
+        except BaseException:
+            self.log(f"Stage {name} failed after {time.perf_counter() - start:.2f}s")
+            raise
+        finally:
+            self.timings[name] = time.perf_counter() - start
+        self.log(f"Stage {name} done in {self.timings[name]:.2f}s")
+
+    def summary(self):
+        return ", ".join(
+            f"{name} {seconds:.2f}s" for name, seconds in self.timings.items()
+        )
+
+
+def run_sql_file(pg_url, sql_file):
+    """Runs a plain SQL file (no psql meta-commands) in one transaction on a pooled connection."""
+    with open(sql_file, "r", encoding="utf-8") as f:
+        sql = f.read()
+    with connection(pg_url) as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+
+
+def run_clean(argv):
+    """
+    Calls 02_extract_and_clean.main(argv) in this process, so shapely,
+    svgpathtools and friends are imported once per watcher, not per upload.
+    """
+    clean = importlib.import_module(CLEAN_MODULE)
+    try:
+        code = clean.main(argv)
+    except SystemExit as e:
+        code = e.code
+    if code:
+        # argv is not logged, it may hold --pg-url with a password
+        raise RuntimeError(f"{CLEAN_MODULE} failed with exit code {code}")
+
+
+def stream_cmd(cmd, log=logger.info, **kwargs):
+    """
+    Runs cmd and logs its combined stdout/stderr line by line as it is
+    produced instead of buffering all of it. Raises RuntimeError with the
+    last lines of output if it fails.
+    """
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    with subprocess.Popen(
+        cmd,
+        shell=isinstance(cmd, str),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        **kwargs,
+    ) as proc:
+        for line in proc.stdout:
+            line = line.rstrip("\n")
+            tail.append(line)
+            log(line)
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f"Command failed ({proc.returncode}): "
+            f"{cmd if isinstance(cmd, str) else ' '.join(cmd)}\n" + "\n".join(tail)
+        )
+    return proc.returncode
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import shapely
+
+from geom_utils import (
+    _svg_path_to_coords_svgpathtools,
+    svg_path_to_coords,
+    svg_paths_to_coords,
+)
+
+PATHS = {
+    "absolute lines": "M10,10 L20,10 L20,20 Z",
+    "relative lines": "m10,10 l10,0 l0,10 z",
+    "absolute h/v": "M10,10 H20 V20 H10 Z",
+    "relative h/v": "m10,10 h10 v10 h-10 z",
+    "mixed case": "M10,10 l5,5 H30 v-10 L40,40 z",
+    "absolute cubic": "M0,0 C10,20 30,20 40,0",
+    "relative cubic": "m5,5 c10,20 30,20 40,0 c5,5 10,5 15,0",
+    "absolute quadratic": "M0,0 Q10,20 20,0",
+    "relative quadratic": "m5,5 q10,20 20,0 q5,5 10,0",
+    "implicit lineto after M": "M1,1 2,2 3,3",
+    "implicit lineto after m": "m1,1 2,2 3,3",
+    "implicit repeats after L": "M0,0 L1,1 2,0 3,1",
+    "implicit repeats after l": "M0,0 l1,1 1,-1 1,1",
+    "implicit repeats after C": "M0,0 C1,1 2,1 3,0 4,-1 5,-1 6,0",
+    "multiple subpaths": "M0,0 L10,0 L10,10 Z M20,20 L30,20 L30,30 Z",
+    "relative subpaths": "m1,1 2,2 l1,1 z m5,5 h1 v1 z l3 3",
+    "line after close": "M0,0 L5,5 L5,0 Z L8,8",
+    "already closed": "M0,0 L1,1 L0,0 Z",
+    "move only": "M0 0",
+    "close only": "M0,0 Z",
+    "no separators": "M1-2-3.5.5L.1.2",
+    "packed decimals": "M.5.5L1.5.5.5-.5",
+    "exponents": "M1e-3,2E2 L1e1,-1.5e+1",
+    "whitespace and commas": "  M 1 , 2\tL3 ,4\n5,6 ",
+}
+
+FALLBACK_PATHS = {
+    "smooth cubic": "M0,0 C10,20 30,20 40,0 S70,-20 80,0",
+    "smooth quadratic": "M0,0 Q10,20 20,0 T40,0",
+    "arc": "M0,0 A10,10 0 0 1 20,0",
+    "relative arc": "m0,0 a10,5 30 1 0 20,10",
+}
+
+
+def reference(d, tolerance=None):
+    return np.asarray(_svg_path_to_coords_svgpathtools(d, tolerance)).reshape(-1, 2)
+
+
+@pytest.mark.parametrize("d", PATHS.values(), ids=PATHS.keys())
+def test_matches_svgpathtools(d):
+    np.testing.assert_array_equal(svg_path_to_coords(d), reference(d))
+
+
+@pytest.mark.parametrize("d", FALLBACK_PATHS.values(), ids=FALLBACK_PATHS.keys())
+@pytest.mark.parametrize("tolerance", [None, 0.5])
+def test_unsupported_commands_fall_back(d, tolerance):
+    np.testing.assert_array_equal(
+        svg_path_to_coords(d, tolerance), reference(d, tolerance)
+    )
+
+
+def test_batch_matches_single_paths():
+    paths = list(PATHS.values()) + list(FALLBACK_PATHS.values())
+    for coords, d in zip(svg_paths_to_coords(paths), paths):
+        np.testing.assert_array_equal(coords, reference(d))
+
+
+def test_malformed_path_is_left_out_of_the_batch():
+    paths = ["M0,0 L1,1", "L1,2", "M5,5 L6,6"]
+    for coords, d in zip(svg_paths_to_coords(paths), paths):
+        np.testing.assert_array_equal(coords, reference(d))
+
+
+@pytest.mark.parametrize("d", ["L1,2", "M1,2 Z", ""])
+def test_single_malformed_path_falls_back(d):
+    np.testing.assert_array_equal(svg_path_to_coords(d), reference(d))
+
+
+@pytest.mark.parametrize("d", ["M1,2 C1", "M1", "M1,2 Z3"])
+def test_invalid_path_raises_the_svgpathtools_error(d):
+    with pytest.raises(ValueError, match="Invalid path string|Unallowed implicit"):
+        svg_path_to_coords(d)
+
+
+@pytest.mark.parametrize("tolerance", [0.1, 1.0])
+def test_densified_curves_stay_within_tolerance(tolerance):
+    d = PATHS["absolute cubic"]
+    coords = svg_path_to_coords(d, tolerance)
+    dense = reference(d, tolerance / 100)
+    assert coords[0].tolist() == [0.0, 0.0] and coords[-1].tolist() == [40.0, 0.0]
+    # Every finely sampled curve point lies within tolerance of the polyline
+    line = shapely.LineString(coords)
+    assert max(line.distance(shapely.points(dense))) <= tolerance + 1e-9
@@ -0,0 +1,320 @@
+import argparse
+import gzip
+import logging
+import math
+import os
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+
+import psycopg2
+
+from geom_utils import map_chunks, split_chunks
+from pg_loader import DATA_DIR, SCHEMA
+
+logger = logging.getLogger(__name__)
+
+TILES_FILE = os.path.join(os.path.dirname(DATA_DIR), "tiles", "openheim.mbtiles")
+SVG_FILE = os.path.join(DATA_DIR, "openheim.svg")
+SVG_HEIGHT = 2000  # Fallback map size when the SVG has no width/height
+MIN_ZOOM = 0
+MAX_ZOOM = 5
+TILE_EXTENT = 4096  # MVT units per tile side
+TILE_BUFFER = 64  # MVT units rendered past the tile edge
+TILE_WORKERS = 4
+CHUNKS_PER_WORKER = 4
+
+# Layer name -> table, SRID of its geometry column and the attribute columns
+LAYERS = {
+    "cells": {"table": "cells_geom", "srid": 4326, "columns": ["id"]},
+    "landmass": {"table": "landmass", "srid": 4326, "columns": ["id", "type"]},
+    "rivers": {"table": "rivers_geom", "srid": 0, "columns": ["id", "name"]},
+    "routes": {"table": "routes_geom", "srid": 4326, "columns": ["id"]},
+    "burgs": {"table": "burgs_pixel_geom", "srid": 0, "columns": ["id"]},
+}
+
+
+def map_size(svg_file=SVG_FILE):
+    """
+    Side of the square pixel space the pyramid covers: max(width, height) of
+    the SVG (a path or a binary file object, e.g. a zip member).
+    """
+    try:
+        for _, elem in ET.iterparse(svg_file, events=("start",)):
+            dims = [
+                float(elem.get(k, "0").rstrip("px") or 0) for k in ("width", "height")
+            ]
+            return max(dims) or SVG_HEIGHT
+    except (OSError, ET.ParseError, ValueError):
+        pass
+    return SVG_HEIGHT
+
+
+def tile_bounds(z, x, y, size):
+    """(xmin, ymin, xmax, ymax) in pixels of XYZ tile z/x/y; y counts from the top."""
+    span = size / 2**z
+    return x * span, size - (y + 1) * span, (x + 1) * span, size - y * span
+
+
+def tiles_for_bbox(bbox, z, size):
+    """XYZ tiles at zoom z whose buffered extent intersects bbox."""
+    n = 2**z
+    span = size / n
+    pad = span * TILE_BUFFER / TILE_EXTENT
+    xmin, ymin, xmax, ymax = bbox
+
+    def clamp(v):
+        return min(max(int(math.floor(v / span)), 0), n - 1)
+
+    for x in range(clamp(xmin - pad), clamp(xmax + pad) + 1):
+        for y in range(clamp(size - ymax - pad), clamp(size - ymin + pad) + 1):
+            yield z, x, y
+
+
+def layer_sql(name, layer, schema):
+    columns = ", ".join(f"t.{c}" for c in layer["columns"])
+    return f"""
+        (SELECT COALESCE(ST_AsMVT(q, '{name}', {TILE_EXTENT}, 'geom'), '')
+         FROM (
+            SELECT {columns},
+                   ST_AsMVTGeom(
+                       ST_Simplify(t.geom, %(tolerance)s, true),
+                       ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, {layer['srid']}),
+                       {TILE_EXTENT}, {TILE_BUFFER}, true
+                   ) AS geom
+            FROM {schema}.{layer['table']} t
+            WHERE t.geom && ST_MakeEnvelope(
+                %(bxmin)s, %(bymin)s, %(bxmax)s, %(bymax)s, {layer['srid']}
+            )
+         ) q
+         WHERE q.geom IS NOT NULL)"""
+
+
+def tile_sql(schema=SCHEMA):
+    """One query that returns the MVT of every layer for a tile, concatenated."""
+    return "SELECT " + " || ".join(
+        layer_sql(name, layer, schema) for name, layer in LAYERS.items()
+    )
+
+
+def _render_tiles(pg_url, tiles, size, schema):
+    """Renders a chunk of tiles on its own connection. Returns [(z, x, y, gzipped MVT or None)]."""
+    query = tile_sql(schema)
+    rendered = []
+    conn = psycopg2.connect(pg_url)
+    try:
+        with conn.cursor() as cur:
+            for z, x, y in tiles:
+                xmin, ymin, xmax, ymax = tile_bounds(z, x, y, size)
+                span = xmax - xmin
+                pad = span * TILE_BUFFER / TILE_EXTENT
+                cur.execute(
+                    query,
+                    {
+                        # One MVT unit at this zoom: finer detail is not visible
+                        "tolerance": span / TILE_EXTENT,
+                        "xmin": xmin,
+                        "ymin": ymin,
+                        "xmax": xmax,
+                        "ymax": ymax,
+                        "bxmin": xmin - pad,
+                        "bymin": ymin - pad,
+                        "bxmax": xmax + pad,
+                        "bymax": ymax + pad,
+                    },
+                )
+                data = bytes(cur.fetchone()[0] or b"")
+                rendered.append((z, x, y, gzip.compress(data) if data else None))
+    finally:
+        conn.close()
+    return rendered
+
+
+def feature_state(conn, schema=SCHEMA):
+    """{(layer, id): (hash, xmin, ymin, xmax, ymax)} of what the tiles are drawn from."""
+    state = {}
+    with conn.cursor() as cur:
+        for name, layer in LAYERS.items():
+            columns = ", ".join(layer["columns"] + ["geom"])
+            cur.execute(
+                f"""
+                SELECT t.id::text, md5(t::text),
+                       ST_XMin(t.geom), ST_YMin(t.geom), ST_XMax(t.geom), ST_YMax(t.geom)
+                FROM (SELECT {columns} FROM {schema}.{layer['table']}) t
+                WHERE t.geom IS NOT NULL
+                """
+            )
+            for key, digest, *bbox in cur:
+                state[(name, key)] = (digest, *bbox)
+    return state
+
+
+def open_mbtiles(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS tiles (
+            zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+            ON tiles (zoom_level, tile_column, tile_row);
+        CREATE TABLE IF NOT EXISTS feature_state (
+            layer TEXT, id TEXT, hash TEXT,
+            xmin REAL, ymin REAL, xmax REAL, ymax REAL,
+            PRIMARY KEY (layer, id)
+        );
+        """
+    )
+    return db
+
+
+def _read_metadata(db):
+    return dict(db.execute("SELECT name, value FROM metadata"))
+
+
+def _read_state(db):
+    return {
+        (layer, key): (digest, *bbox)
+        for layer, key, digest, *bbox in db.execute("SELECT * FROM feature_state")
+    }
+
+
+def dirty_tiles(old, new, zooms, size):
+    """Tiles touched by features that were added, changed or removed, old and new extent."""
+    tiles = set()
+    for key in old.keys() | new.keys():
+        before, after = old.get(key), new.get(key)
+        if before is not None and after is not None and before[0] == after[0]:
+            continue
+        for state in (before, after):
+            if state is not None:
+                for z in zooms:
+                    tiles.update(tiles_for_bbox(state[1:], z, size))
+    return tiles
+
+
+def render_pyramid(
+    pg_url,
+    path=TILES_FILE,
+    min_zoom=MIN_ZOOM,
+    max_zoom=MAX_ZOOM,
+    workers=TILE_WORKERS,
+    size=None,
+    schema=SCHEMA,
+    full=False,
+):
+    """
+    Pre-renders the MVT pyramid of the LAYERS into an MBTiles file. Only the
+    tiles touched by features whose content changed since the last run are
+    re-rendered, unless the file is new, the zoom range or map size changed
+    or full=True. Returns the number of tiles rendered.
+    """
+    start = time.perf_counter()
+    size = size or map_size()
+    zooms = range(min_zoom, max_zoom + 1)
+    db = open_mbtiles(path)
+    try:
+        conn = psycopg2.connect(pg_url)
+        try:
+            new_state = feature_state(conn, schema)
+        finally:
+            conn.close()
+
+        metadata = _read_metadata(db)
+        settings = {
+            "minzoom": str(min_zoom),
+            "maxzoom": str(max_zoom),
+            "map_size": repr(float(size)),
+        }
+        full = full or any(metadata.get(k) != v for k, v in settings.items())
+        if full:
+            tiles = [(z, x, y) for z in zooms for x in range(2**z) for y in range(2**z)]
+            db.execute("DELETE FROM tiles")
+        else:
+            tiles = sorted(dirty_tiles(_read_state(db), new_state, zooms, size))
+        logger.info(
+            f"Rendering {len(tiles)} tiles ({'full' if full else 'changed only'}, "
+            f"zoom {min_zoom}-{max_zoom}) into {path}"
+        )
+
+        chunks = [
+            (pg_url, chunk, size, schema)
+            for chunk in split_chunks(tiles, workers * CHUNKS_PER_WORKER)
+        ]
+        for rendered in map_chunks(_render_tiles, chunks, workers):
+            for z, x, y, data in rendered:
+                # MBTiles rows count from the bottom (TMS)
+                row = 2**z - 1 - y
+                if data is None:
+                    db.execute(
+                        "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? "
+                        "AND tile_row = ?",
+                        (z, x, row),
+                    )
+                else:
+                    db.execute(
+                        "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+                        (z, x, row, data),
+                    )
+
+        db.execute("DELETE FROM feature_state")
+        db.executemany(
+            "INSERT INTO feature_state VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((layer, key, *state) for (layer, key), state in new_state.items()),
+        )
+        settings.update(
+            {
+                "name": "openheim",
+                "format": "pbf",
+                "type": "overlay",
+                "bounds": f"0,0,{size},{size}",
+                "json": '{"vector_layers": ['
+                + ", ".join(f'{{"id": "{name}", "fields": {{}}}}' for name in LAYERS)
+                + "]}",
+            }
+        )
+        db.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?)", settings.items()
+        )
+        db.commit()
+    finally:
+        db.close()
+    logger.info(f"Rendered {len(tiles)} tiles in {time.perf_counter() - start:.2f}s")
+    return len(tiles)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename="data-loader.log",
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    parser = argparse.ArgumentParser(
+        description="Pre-render the MVT tile pyramid of the imported map into MBTiles."
+    )
+    parser.add_argument("--pg-url", default=os.environ.get("PG_DB_URL"))
+    parser.add_argument("--out", default=TILES_FILE)
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    parser.add_argument("--workers", type=int, default=TILE_WORKERS)
+    parser.add_argument("--full", action="store_true", help="Re-render every tile.")
+    parser.add_argument(
+        "--svg", default=SVG_FILE, help="SVG whose width/height the pyramid covers."
+    )
+    args = parser.parse_args()
+    if not args.pg_url:
+        parser.error("--pg-url or PG_DB_URL is required")
+    print(
+        render_pyramid(
+            args.pg_url,
+            args.out,
+            args.min_zoom,
+            args.max_zoom,
+            args.workers,
+            size=map_size(args.svg),
+            full=args.full,
+        ),
+        "tiles rendered",
+    )
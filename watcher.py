@@ -1,19 +1,22 @@
 import os
-import time
-import subprocess
 import sys
 import shutil
-import psycopg2
 import logging
-from datetime import datetime, timezone
+import threading
 from zipfile import ZipFile
 from dotenv import load_dotenv
 from logging.handlers import TimedRotatingFileHandler
+from file_watch import watch_files
+from job_queue import JOB_DB, SUPERSEDED, JobQueue
+from schema_swap import staging_schema_name, swap_enabled
+from stage_cache import StageCache
+from metrics import Metrics
+from stage_runner import StageRunner, run_clean, run_sql_file, stream_cmd
 from db_utils import (
-    set_previous_active_to_passed,
     insert_fileupload_entry,
     update_fileupload_status,
-    get_next_version,
+    claim_next_version,
+    close_pools,
 )
 
 load_dotenv()
@@ -21,19 +24,41 @@ load_dotenv()
 WATCH_DIR = next(
     (arg for arg in sys.argv[1:] if not arg.startswith("-")), "/var/www/html/azgaar"
 )
-DATA_DIR = "/srv/data-loader/data"
+# Per-version directory for the files an import writes; the upload itself is
+# read straight from the zip and never extracted
+SCRATCH_DIR = "/srv/data-loader/scratch"
 ARCHIVE_DIR = "/srv/data-loader/processed_zips"
 FAILED_DIR = "/srv/data-loader/failed_zips"
 LOG_FILE = "data-loader.log"
-POLL_INTERVAL = 10  # seconds
+POLL_INTERVAL = 10  # seconds, only where inotify is not available
+# Imports that may run at once; uploads of the same map always run one by one
+WATCHER_WORKERS = int(os.environ.get("WATCHER_WORKERS", "2"))
+MAP_NAME = "openheim"
 PG_USER = os.environ.get("PG_USER")
 PG_PASSWORD = os.environ.get("PG_PASSWORD")
 PG_DATABASE = os.environ.get("PG_DATABASE", "")
 PG_DB_URL = os.getenv("PG_DB_URL")  # Set via environment or .env
 DDL_SQL = "01_spatial_schema.sql"
 CLEAN_PY = "02_extract_and_clean.py"
-OGR2OGR_SH = "03_ogr2ogr_import.sh"
-ATTR_SQL = "04_bulk_attribute_import.sql"
+# Load into spatial_<version> and swap it in (SCHEMA_SWAP=1 or -swap)
+USE_SCHEMA_SWAP = "-swap" in sys.argv or swap_enabled()
+# Only apply what changed since the last import (DELTA_IMPORT=1 or -delta)
+USE_DELTA_IMPORT = not USE_SCHEMA_SWAP and (
+    "-delta" in sys.argv
+    or os.environ.get("DELTA_IMPORT", "").lower() in ("1", "true", "yes", "on")
+)
+# Pre-render the vector tile pyramid after the import (RENDER_TILES=1 or -tiles)
+RENDER_TILES = "-tiles" in sys.argv or (
+    os.environ.get("RENDER_TILES", "").lower() in ("1", "true", "yes", "on")
+)
+# Format of the cleaned files in the scratch directory: "geojson" or
+# "geoparquet" (INTERMEDIATE_FORMAT, the latter needs pyarrow)
+INTERMEDIATE_FORMAT = os.environ.get("INTERMEDIATE_FORMAT", "geojson").lower()
+# Run psql and the cleaning script as separate processes, as before the
+# in-process stage runner (PIPELINE_SUBPROCESS=1 or -subprocess)
+USE_SUBPROCESS = "-subprocess" in sys.argv or (
+    os.environ.get("PIPELINE_SUBPROCESS", "").lower() in ("1", "true", "yes", "on")
+)
 
 
 REQUIRED_FILES = [
@@ -86,28 +111,30 @@ def prune_archive_dir():
             log(f"Failed to delete old zip {old_file}: {e}")
 
 
+def prune_stage_cache():
+    """
+    Drop least recently used stage cache entries beyond the cache limits.
+    """
+    try:
+        removed = StageCache().evict()
+        if removed:
+            log(f"Evicted {removed} old stage cache entries")
+    except Exception as e:
+        log(f"Failed to prune stage cache: {e}")
+
+
 def run_cmd(cmd, **kwargs):
-    result = subprocess.run(
-        cmd,
-        shell=isinstance(cmd, str),
-        capture_output=True,
-        text=True,
-        **kwargs,
-    )
-    if result.returncode != 0:
-        error_msg = (
-            f"Command failed: {cmd if isinstance(cmd, str) else ' '.join(cmd)}\n"
-            f"stdout: {result.stdout.strip()}\n"
-            f"stderr: {result.stderr.strip()}"
-        )
-        print(error_msg, flush=True)
-        logging.error(error_msg)
-        raise RuntimeError(error_msg)
-    return result
+    """Runs cmd, streaming its output to the log; raises RuntimeError on failure."""
+    try:
+        return stream_cmd(cmd, log=log, **kwargs)
+    except RuntimeError as e:
+        print(e, flush=True)
+        logging.error(str(e))
+        raise
 
 
 def ensure_dirs():
-    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
     os.makedirs(ARCHIVE_DIR, exist_ok=True)
     os.makedirs(FAILED_DIR, exist_ok=True)
 
@@ -123,69 +150,103 @@ def check_zip_contents(zip_path):
         return True
 
 
-def process_zip(zip_path, env, version):
+def process_zip(zip_path, env, version, progress=None):
+    progress = progress or (lambda stage: None)
+
     # 1. Check contents before extraction
     if not check_zip_contents(zip_path):
         log("Aborting import. Zip is missing required files.")
         move_to_failed(zip_path, env)
         return
 
-    # 2. Unzip to DATA_DIR (overwrite)
-    shutil.unpack_archive(zip_path, DATA_DIR)
-    log(f"Extracted zip to {DATA_DIR}")
-
-    # 3. Run DDL SQL
-    result = run_cmd(
-        [
-            "psql",
-            PG_DATABASE,
-            "-U",
-            PG_USER,
-            "-v",
-            "ON_ERROR_STOP=1",
-            "-f",
-            DDL_SQL,
-        ],
-        env=env,
-    )
-    if result.returncode != 0:
-        print(result.stderr, flush=True)
-
-    log(f"SUCCESS: spatial schema created with {DDL_SQL}")
-
-    # 4. Run Python cleaning script
-    run_cmd([sys.executable, CLEAN_PY])
-    log(f"SUCCESS: cleaning script {CLEAN_PY} executed successfully")
-
-    # 5. Run ogr2ogr import script
-    run_cmd(
-        ["bash", OGR2OGR_SH],
-        env=env,
-    )
-    log(f"SUCCESS: ogr2ogr import script {OGR2OGR_SH} executed successfully")
-
-    # 6. Run bulk attribute SQL
-    run_cmd(
-        [
-            "psql",
-            PG_DATABASE,
-            "-U",
-            PG_USER,
-            "-v",
-            "ON_ERROR_STOP=1",
-            "-f",
-            ATTR_SQL,
-        ],
-        env=env,
-    )
-    log(f"SUCCESS: bulk attribute import with {ATTR_SQL}")
+    metrics = Metrics("watcher", version)
+    runner = StageRunner(log, metrics)
+    try:
+        run_stages(zip_path, env, version, progress, runner)
+    finally:
+        metrics.write_prometheus()
 
-    log("All steps completed successfully.")
 
-    # 7. Move the zip to ARCHIVE
+def run_stages(zip_path, env, version, progress, runner):
+    # 2. Fresh scratch directory for this version; the zip is not extracted,
+    #    02_extract_and_clean.py streams its members with --zip
+    scratch_dir = os.path.join(SCRATCH_DIR, version)
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+    os.makedirs(scratch_dir)
+    try:
+        import_zip(zip_path, env, version, progress, runner, scratch_dir)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    log("All steps completed successfully.")
+    archive_zip(zip_path, version, progress, runner)
+
+
+def import_zip(zip_path, env, version, progress, runner, scratch_dir):
+    # 3. Run DDL SQL (skipped with SCHEMA_SWAP, which builds its own schema, and
+    #    with DELTA_IMPORT, which updates the existing tables in place)
+    if USE_SCHEMA_SWAP:
+        log(f"SCHEMA_SWAP set: loading into {staging_schema_name(version)}")
+    elif USE_DELTA_IMPORT:
+        log("DELTA_IMPORT set: keeping the existing spatial tables")
+    else:
+        with runner.stage("schema"):
+            if USE_SUBPROCESS:
+                run_cmd(
+                    [
+                        "psql",
+                        PG_DATABASE,
+                        "-U",
+                        PG_USER,
+                        "-v",
+                        "ON_ERROR_STOP=1",
+                        "-f",
+                        DDL_SQL,
+                    ],
+                    env=env,
+                )
+            else:
+                run_sql_file(PG_DB_URL, DDL_SQL)
+
+        log(f"SUCCESS: spatial schema created with {DDL_SQL}")
+        progress("schema")
+
+    # 4. Clean and import; --load COPYs the geometries and runs the bulk
+    #    attribute SQL, independent tables in parallel
+    clean_args = [
+        "--load",
+        "--run-id",
+        version,
+        "--zip",
+        zip_path,
+        "--data-dir",
+        scratch_dir,
+    ]
+    if USE_SCHEMA_SWAP:
+        clean_args += ["--swap-version", version]
+    elif USE_DELTA_IMPORT:
+        clean_args.append("--delta")
+    if RENDER_TILES:
+        clean_args.append("--tiles")
+    if INTERMEDIATE_FORMAT != "geojson":
+        clean_args += ["--intermediate", INTERMEDIATE_FORMAT]
+    with runner.stage("clean_and_import"):
+        if USE_SUBPROCESS:
+            run_cmd([sys.executable, CLEAN_PY] + clean_args, env=env)
+        else:
+            run_clean(clean_args + ["--pg-url", PG_DB_URL])
+    log(f"SUCCESS: cleaning and import {CLEAN_PY} executed successfully")
+    progress("imported")
+
+
+def archive_zip(zip_path, version, progress, runner):
+    # 5. Move the zip to ARCHIVE
     archive_path = os.path.join(ARCHIVE_DIR, os.path.basename(zip_path))
-    shutil.move(zip_path, archive_path)
+    with runner.stage("archive"):
+        shutil.move(zip_path, archive_path)
     log(f"Archived {zip_path}.")
+    progress("archived")
+    log(f"Stage timings for {os.path.basename(zip_path)}: {runner.summary()}")
 
     # DB update for PASSED and ACTIVE
     try:
@@ -203,6 +264,7 @@ def process_zip(zip_path, env, version):
         log(f"ERROR: Failed to update regular.fileupload DB on archive: {e}")
 
     prune_archive_dir()
+    prune_stage_cache()
 
 
 def move_to_failed(zip_path, env):
@@ -224,6 +286,60 @@ def move_to_failed(zip_path, env):
         log(f"ERROR: Could not move failed zip {zip_path} to {FAILED_DIR}: {ex}")
 
 
+def run_job(queue, job, env):
+    zip_path = job["path"]
+    archive_path = os.path.join(ARCHIVE_DIR, os.path.basename(zip_path))
+    if not os.path.exists(zip_path) and os.path.exists(archive_path):
+        # Stopped after archiving, the import itself went through
+        log(f"Job {job['id']} for {zip_path} was already archived")
+        queue.finish(job["id"])
+        return
+    try:
+        process_zip(
+            zip_path,
+            env,
+            job["version"],
+            progress=lambda stage: queue.set_stage(job["id"], stage),
+        )
+    except Exception as e:
+        log(f"ERROR: Exception during zip processing: {e}")
+        queue.finish(job["id"], error=str(e))
+    else:
+        queue.finish(job["id"])
+
+
+def import_worker(queue, wakeup, env):
+    """Runs queued jobs until the watcher exits, waiting for new ones in between."""
+    while True:
+        with wakeup:
+            job, superseded = queue.claim()
+            if job is None:
+                wakeup.wait()
+                continue
+        for old in superseded:
+            # Only the newest upload of a map is imported
+            archive_path = os.path.join(ARCHIVE_DIR, os.path.basename(old["path"]))
+            try:
+                if os.path.exists(old["path"]):
+                    shutil.move(old["path"], archive_path)
+                log(f"Skipped {old['path']}, superseded by {job['path']}")
+                update_fileupload_status(
+                    path=archive_path,
+                    baseName=old["map"],
+                    name=os.path.basename(old["path"]),
+                    status=SUPERSEDED,
+                    version=old["version"],
+                    pg_url=PG_DB_URL,
+                )
+            except Exception as e:
+                log(f"ERROR: Could not archive superseded zip {old['path']}: {e}")
+        log(f"Starting job {job['id']}: {job['path']} (version {job['version']})")
+        run_job(queue, job, env)
+        with wakeup:
+            # The map is free again, a queued upload of it may start now
+            wakeup.notify_all()
+
+
 def main():
     is_test_mode = "-test" in sys.argv
     if is_test_mode:
@@ -239,33 +355,48 @@ def main():
     env["PG_DB_URL"] = PG_DB_URL
 
     ensure_dirs()
-    log(f"Watching folder: {WATCH_DIR} for openheim.zip ...")
-    while True:
-        original_zip = os.path.join(WATCH_DIR, "openheim.zip")
-        log(f"Polling for file: {original_zip}")
-        if os.path.isfile(original_zip):
+    queue = JobQueue(JOB_DB)
+    recovered = queue.recover()
+    if recovered:
+        log(f"Resuming {recovered} import(s) interrupted by the last shutdown")
+    wakeup = threading.Condition()
+    for _ in range(WATCHER_WORKERS):
+        threading.Thread(
+            target=import_worker, args=(queue, wakeup, env), daemon=True
+        ).start()
+
+    log(f"Watching folder: {WATCH_DIR} for {MAP_NAME}.zip ...")
+    try:
+        for original_zip in watch_files(
+            WATCH_DIR, lambda name: name == f"{MAP_NAME}.zip", POLL_INTERVAL
+        ):
             try:
-                version = get_next_version(PG_DB_URL, "openheim.zip")
-                renamed_zip = os.path.join(WATCH_DIR, f"openheim_{version}.zip")
+                version = claim_next_version(
+                    PG_DB_URL, f"{MAP_NAME}.zip", MAP_NAME, WATCH_DIR
+                )
+                renamed_zip = os.path.join(WATCH_DIR, f"{MAP_NAME}_{version}.zip")
                 os.rename(original_zip, renamed_zip)
                 log(f"Found and moved file to {renamed_zip}")
 
                 if is_test_mode:
-                    test_filename = f"openheim_{version}.zip"
+                    test_filename = f"{MAP_NAME}_{version}.zip"
                     insert_fileupload_entry(
                         name=test_filename,
-                        baseName="openheim",
+                        baseName=MAP_NAME,
                         path=renamed_zip,
                         version=version,
                         status="uploaded",
                         pg_url=PG_DB_URL,
                     )
 
-                process_zip(renamed_zip, env, version)
+                with wakeup:
+                    queue.enqueue(MAP_NAME, renamed_zip, version)
+                    wakeup.notify_all()
+                log(f"Queued {renamed_zip} ({queue.pending()} pending import(s))")
             except Exception as e:
                 log(f"ERROR: Exception during zip processing: {e}")
-
-        time.sleep(POLL_INTERVAL)
+    finally:
+        close_pools()
 
 
 if __name__ == "__main__":
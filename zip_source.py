@@ -0,0 +1,74 @@
+import hashlib
+import io
+import os
+from zipfile import ZipFile
+
+HASH_CHUNK = 1 << 20
+
+
+class ZipSource:
+    """
+    An uploaded FMG zip read in place: members are streamed out of the
+    archive when they are used instead of being extracted first.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.zf = ZipFile(path, "r")
+        self.names = set(self.zf.namelist())
+
+    def member(self, name):
+        return ZipMember(self, name)
+
+    def close(self):
+        self.zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ZipMember:
+    """One file of a ZipSource, usable wherever the pipeline takes an input path."""
+
+    def __init__(self, source, name):
+        self.source = source
+        self.name = name
+
+    def exists(self):
+        return self.name in self.source.names
+
+    def open(self, text=False):
+        # ZipFile allows several members to be read at once, e.g. by parallel COPYs
+        f = self.source.zf.open(self.name, "r")
+        return io.TextIOWrapper(f, encoding="utf-8", newline="") if text else f
+
+    def __str__(self):
+        return f"{self.source.path}:{self.name}"
+
+
+def source_exists(source):
+    """True if a file path or ZipMember can be read."""
+    if isinstance(source, ZipMember):
+        return source.exists()
+    return os.path.exists(source)
+
+
+def open_source(source, text=True):
+    """Opens a file path or ZipMember for reading, as UTF-8 text or bytes."""
+    if isinstance(source, ZipMember):
+        return source.open(text)
+    if text:
+        return open(source, "r", newline="", encoding="utf-8")
+    return open(source, "rb")
+
+
+def source_sha256(source):
+    digest = hashlib.sha256()
+    with open_source(source, text=False) as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()